@@ -1,21 +1,181 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import re
+import sys
 import time
 import json
+import zlib
+import uuid
 import logging
-import requests
+from Queue import Queue, Empty
+from threading import Condition, Thread
 from datetime import datetime
-from redis import StrictRedis
+from markmentio import settings
 from markmentio.log import logger
+from markmentio.httppool import get_http_session
+from markmentio.cache import get_local_cache, in_flight, stats as cache_stats
+from markmentio.ratelimit import RateLimitBudget, INTERACTIVE
+from markmentio.redispool import get_redis, CACHE
+
+_cache_redis = None
+
+# github paths a push to a repository makes outdated, and the tag their
+# cache keys are indexed under, so they can be found without KEYS/SCAN
+INVALIDATED_PATHS = [
+    (re.compile(r'^/repos/([^/]+/[^/?]+)(?:[/?]|$)'), 'repo:{0}'),
+    (re.compile(r'^/(?:orgs|users)/([^/]+)/repos(?:[/?]|$)'), 'owner:{0}'),
+]
+# objects addressed by their sha never change
+IMMUTABLE_PATH = re.compile(r'/git/(?:trees|blobs|commits)/[0-9a-f]{40}(?:[/?]|$)')
+CACHE_INDEX = "cache:index:{0}"
+
+# deletes a lock only if it is still the one we took
+RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def get_cache_redis():
+    global _cache_redis
+    if _cache_redis is None:
+        _cache_redis = get_redis(CACHE)
+
+    return _cache_redis
+
+
+def bounded_imap(function, items, fan_out):
+    """Yields `function(item)` for each one of the items, in order,
+    while running up to `fan_out` calls at the same time. The first
+    error is re-raised once its turn to be yielded comes."""
+    items = list(items)
+    pending = Queue()
+    for pair in enumerate(items):
+        pending.put(pair)
+
+    done = {}
+    ready = Condition()
+
+    def work():
+        while True:
+            try:
+                index, item = pending.get_nowait()
+            except Empty:
+                return
+
+            try:
+                outcome = (True, function(item))
+            except BaseException:
+                # anything left unrecorded would keep the consumer waiting
+                outcome = (False, sys.exc_info())
+
+            with ready:
+                done[index] = outcome
+                ready.notify_all()
+
+    for _ in range(min(fan_out, len(items))):
+        worker = Thread(target=work)
+        worker.daemon = True
+        worker.start()
+
+    try:
+        for index in range(len(items)):
+            with ready:
+                while index not in done:
+                    ready.wait()
+                succeeded, value = done.pop(index)
+
+            if not succeeded:
+                raise value[0], value[1], value[2]
+
+            yield value
+    finally:
+        # nobody is waiting for the rest anymore
+        while not pending.empty():
+            try:
+                pending.get_nowait()
+            except Empty:
+                break
+
+
+def cache_tags(path):
+    """Returns the tags the cached copy of `path` is indexed under"""
+    if IMMUTABLE_PATH.search(path):
+        return []
+
+    tags = []
+    for pattern, tag in INVALIDATED_PATHS:
+        found = pattern.search(path)
+        if found:
+            tags.append(tag.format(found.group(1).lower()))
+
+    return tags
+
+
+def repository_tags(owner, repository):
+    """Returns the tags of everything a push to a repository affects:
+    the repository itself and the listings of its owner."""
+    return [
+        'repo:{0}/{1}'.format(owner, repository).lower(),
+        'owner:{0}'.format(owner).lower(),
+    ]
+
+
+def invalidate_cache(tags):
+    """Drops every cached response indexed under the given tags, and
+    returns how many there were."""
+    redis = get_cache_redis()
+    indexes = [CACHE_INDEX.format(tag) for tag in tags]
+    if not indexes:
+        return 0
+
+    pipe = redis.pipeline()
+    for index in indexes:
+        pipe.smembers(index)
+    pipe.delete(*indexes)
+    found = pipe.execute()[:-1]
+
+    keys = set().union(*found)
+    if keys:
+        redis.delete(*keys)
+
+    local = get_local_cache()
+    if local:
+        for key in keys:
+            local.delete(key)
+
+    return len(keys)
+
+
+def response_header(response, name):
+    """Case-insensitive lookup of a header in a primitive response"""
+    for key, value in response['response_headers'].items():
+        if key.lower() == name:
+            return value
 
 
 class GithubEndpoint(object):
     base_url = u'https://api.github.com'
-    TIMEOUT = 60 * 30  # 30 minutes
-    def __init__(self, token, public=False):
+    TIMEOUT = settings.API_CACHE_TIMEOUT
+    # how long expired entries are kept around to be revalidated
+    REVALIDATION_TIMEOUT = 60 * 60 * 24  # 1 day
+    # entries in any other format are ignored, bump it when changing it
+    CACHE_FORMAT = b"md2|"
+    CACHED_HEADERS = ('link', 'etag', 'last-modified')
+    MAX_CACHE_ENTRY_SIZE = 1024 * 1024
+    # how long expired entries are still served while being refreshed
+    STALE_TIMEOUT = settings.API_CACHE_STALE_TIMEOUT
+    # how long a process may hold the lock on a url it is fetching
+    FETCH_LOCK_TIMEOUT = 10
+    FETCH_LOCK_POLL_INTERVAL = 0.05
+    def __init__(self, token, public=False, priority=INTERACTIVE):
         self.token = token
-        self.redis = StrictRedis(db=1)
+        self.redis = get_cache_redis()
+        self.http = get_http_session()
+        self.budget = RateLimitBudget(self.redis, token)
+        self.priority = priority
 
         self.public = public
         self.headers = {
@@ -30,10 +190,25 @@ class GithubEndpoint(object):
 
     def find_cache_object(self, url):
         key = self.key(url)
+        local = get_local_cache()
+        if local:
+            response = local.get(key)
+            if response:
+                cache_stats.hit('local')
+                return response
+
+            cache_stats.miss('local')
+
         data = self.redis.get(key)
-        if data:
+        if data and data.startswith(self.CACHE_FORMAT):
+            cache_stats.hit('redis')
             self.log.info("GET from CACHE %s at %s", url, str(time.time()))
-            return json.loads(data)
+            response = self.decode_cache_object(data)
+            if local:
+                local.set(key, response, response['expires_at'], len(response['response_data']))
+            return response
+
+        cache_stats.miss('redis')
 
     def key(self, url):
         if self.public:
@@ -43,10 +218,68 @@ class GithubEndpoint(object):
 
         return key
 
+    def encode_cache_object(self, response):
+        """Packs only what `retrieve` callers need: a small JSON header
+        line followed by the zlib-compressed body."""
+        headers = dict([(k.lower(), v) for k, v in response['response_headers'].items()
+                        if k.lower() in self.CACHED_HEADERS])
+        meta = json.dumps({
+            'url': response['url'],
+            'status_code': response['status_code'],
+            'response_headers': headers,
+            'expires_at': response['expires_at'],
+        })
+        return b"".join([self.CACHE_FORMAT, meta, b"\n", zlib.compress(response['response_data'])])
+
+    def decode_cache_object(self, data):
+        meta, body = data[len(self.CACHE_FORMAT):].split(b"\n", 1)
+        response = json.loads(meta)
+        response['response_data'] = zlib.decompress(body)
+        response['cached'] = True
+        return response
+
     def create_cache_object(self, response):
         key = self.key(response['url'])
-        content = json.dumps(response)
-        self.redis.setex(key, self.TIMEOUT, content)
+        response['expires_at'] = time.time() + self.TIMEOUT
+        content = self.encode_cache_object(response)
+        if len(content) > self.MAX_CACHE_ENTRY_SIZE:
+            self.log.warning("Not caching %s because it is too big: %s", response['url'], len(content))
+            return False
+
+        lifetime = self.TIMEOUT + self.REVALIDATION_TIMEOUT
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.setex(key, lifetime, content)
+        for tag in cache_tags(response['url'][len(self.base_url):]):
+            pipe.sadd(CACHE_INDEX.format(tag), key)
+            pipe.expire(CACHE_INDEX.format(tag), lifetime)
+        pipe.execute()
+
+        local = get_local_cache()
+        if local:
+            local.set(key, dict(response, cached=True), response['expires_at'], len(response['response_data']))
+
+        return True
+
+    def is_expired(self, response):
+        expires_at = response.get('expires_at')
+        return expires_at is not None and expires_at <= time.time()
+
+    def is_stale(self, response):
+        """Tells whether an expired `response` is recent enough to be
+        served while a fresh copy is fetched in the background."""
+        expires_at = response.get('expires_at')
+        return expires_at is not None and time.time() < expires_at + self.STALE_TIMEOUT
+
+    def conditional_headers(self, response):
+        headers = dict(self.headers)
+        etag = response_header(response, 'etag')
+        last_modified = response_header(response, 'last-modified')
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+        return headers
 
     def get_from_cache(self, path, headers, data=None):
         url = self.full_url(path)
@@ -64,14 +297,16 @@ class GithubEndpoint(object):
         response = {}
         error = None
         try:
+            self.budget.wait(self.priority)
             self.log.info("GET from WEB %s at %s", url, str(time.time()))
-            response = requests.get(**request)
+            response = self.http.get(**request)
+            self.budget.record(response.headers)
         except Exception as e:
             error = e
             self.log.exception("Error retrieving `%s` with data %s", path, repr(data))
         primitive_response = self.make_primitive_response(url, headers, data, response)
 
-        if str(response.status_code).startswith("2"):
+        if str(response.status_code).startswith("2") or response.status_code == 304:
             return primitive_response
 
         self.log.warning("Failed to retrieve `%s` with data %s", path, json.dumps(primitive_response, indent=2))
@@ -88,8 +323,10 @@ class GithubEndpoint(object):
         response = {}
         error = None
         try:
+            self.budget.wait(self.priority)
             self.log.info("POST from WEB %s at %s", url, str(time.time()))
-            response = requests.post(**request)
+            response = self.http.post(**request)
+            self.budget.record(response.headers)
         except Exception as e:
             error = e
             self.log.exception("Failed to create `%s` with data %s", path, repr(data))
@@ -113,19 +350,69 @@ class GithubEndpoint(object):
         }
 
     def retrieve(self, path, data=None, skip_cache=False):
-        headers = self.headers
         if skip_cache:
-            response = None
-        else:
-            response = self.get_from_cache(path, headers, data)
+            # nothing reads these back, they would only take up redis
+            return self.refresh(path, None, data, cache=False)
+
+        cached = self.get_from_cache(path, self.headers, data)
+        if cached and not self.is_expired(cached):
+            return cached
+
+        # concurrent misses for the same url share a single github call
+        key = self.key(self.full_url(path))
+        if cached and self.is_stale(cached):
+            in_flight.do_in_background(key, lambda: self.retrieve_once(path, key, data))
+            return cached
+
+        return in_flight.do(key, lambda: self.retrieve_once(path, key, data))
+
+    def retrieve_once(self, path, key, data=None):
+        """Fetches `path` while holding a short redis lock on its cache
+        key, so that other processes missing the same url wait for this
+        fetch to land in the cache instead of repeating it."""
+        lock_key = "lock:{0}".format(key)
+        owner = uuid.uuid4().hex
+        if not self.redis.set(lock_key, owner, ex=self.FETCH_LOCK_TIMEOUT, nx=True):
+            deadline = time.time() + self.FETCH_LOCK_TIMEOUT
+            while self.redis.exists(lock_key) and time.time() < deadline:
+                time.sleep(self.FETCH_LOCK_POLL_INTERVAL)
+
+            cached = self.get_from_cache(path, self.headers, data)
+            if cached and not self.is_expired(cached):
+                return cached
+
+            # the other fetch failed or is taking too long
+            return self.refresh(path, cached, data)
+
+        try:
+            # it may have landed while we were taking the lock
+            cached = self.get_from_cache(path, self.headers, data)
+            if cached and not self.is_expired(cached):
+                return cached
+
+            return self.refresh(path, cached, data)
+        finally:
+            self.redis.eval(RELEASE_LOCK, 1, lock_key, owner)
+
+    def refresh(self, path, cached=None, data=None, cache=True):
+        """Fetches `path` from github and caches it unless told not to,
+        revalidating the `cached` copy when there is one."""
+        headers = self.headers
+        if cached:
+            # github doesn't count a 304 against the rate limit
+            headers = self.conditional_headers(cached)
 
+        response = self.get_from_web(path, headers, data)
         if not response:
-            response = self.get_from_web(path, headers, data)
-            length = len(response['response_data'])
-            if response and length < 1024 * 1024:
-                self.create_cache_object(response)
-            else:
-                self.log.warning("Not caching %s because it is too big: %s", path, length)
+            return response
+
+        if response['status_code'] == 304:
+            self.log.info("%s was not modified, revalidated the cached copy", path)
+            self.create_cache_object(cached)
+            return cached
+
+        if cache:
+            self.create_cache_object(response)
 
         return response
 
@@ -133,35 +420,89 @@ class GithubEndpoint(object):
         return self.post(path, data, self.headers)
 
     def save(self, path, data=None):
-        return self.json(requests.put(
+        return self.json(self.http.put(
             self.full_url(path),
             headers=self.headers,
         ))
 
+    def imap(self, function, items):
+        """Yields `function(item)` for each one of the items, in order,
+        fanning out up to `API_PAGINATION_FAN_OUT` calls at once."""
+        return bounded_imap(function, items, settings.API_PAGINATION_FAN_OUT)
+
+    def stream(self, path, headers=None):
+        """Returns the raw response of a GET without reading its body,
+        meant for downloads that are too big to be held in memory."""
+        url = self.full_url(path)
+        headers = dict(self.headers, **(headers or {}))
+        self.budget.wait(self.priority)
+        self.log.info("STREAM from WEB %s at %s", url, str(time.time()))
+        response = self.http.get(url, headers=headers, stream=True)
+        self.budget.record(response.headers)
+        response.raise_for_status()
+        return response
+
 
 class Resource(object):
     def __init__(self, endpoint):
         self.endpoint = endpoint
 
     @classmethod
-    def from_token(cls, token):
-        endpoint = GithubEndpoint(token)
+    def from_token(cls, token, endpoint_class=GithubEndpoint):
+        endpoint = endpoint_class(token)
         return cls(endpoint)
 
-    def get_next_path(self, response):
-        raw = response['response_headers'].get('link')
-        # https://api.github.com/user/54914/repos?sort=pushed&page=2>; rel="next",
-        if raw:
-            found = re.search(r'https://api.github.com([^;]+); rel="next"', raw)
-            if found:
-                return found.group(1)
+    def get_links(self, response):
+        raw = response_header(response, 'link') or ''
+        # <https://api.github.com/user/54914/repos?sort=pushed&page=2>; rel="next",
+        found = re.findall(r'<https://api\.github\.com([^>]+)>;\s*rel="(\w+)"', raw)
+        return dict([(rel, path) for path, rel in found])
 
-    def get_path_recursively(self, path):
+    def get_next_path(self, response):
+        return self.get_links(response).get('next')
+
+    def get_page_paths(self, response):
+        """Returns the paths of every page after the given one, as long
+        as github tells which one is the last page."""
+        links = self.get_links(response)
+        last_path = links.get('last')
+        next_path = links.get('next')
+        if not last_path or not next_path:
+            return None
+
+        page = lambda path: int(re.search(r'[?&]page=(\d+)', path).group(1))
+        return [re.sub(r'([?&]page=)\d+', r'\g<1>{0}'.format(number), last_path)
+                for number in range(page(next_path), page(last_path) + 1)]
+
+    def get_page(self, path):
         response = self.endpoint.retrieve(path)
-        value = json.loads(response['response_data'])
+        return json.loads(response['response_data']), response
+
+    def iter_pages(self, path):
+        """Yields the contents of every page of a paginated listing, in
+        order. Once the first page tells how many there are, the others
+        are fetched concurrently, as many at once as the endpoint allows."""
+        value, response = self.get_page(path)
+        yield value
+
+        paths = self.get_page_paths(response)
+        if paths is not None:
+            fetch = lambda path: self.get_page(path)[0]
+            for value in self.endpoint.imap(fetch, paths):
+                yield value
+            return
+
+        # no rel="last" to go by, one page at a time then
         next_path = self.get_next_path(response)
-        if next_path:
-            value += self.get_path_recursively(next_path)
+        while next_path:
+            value, response = self.get_page(next_path)
+            yield value
+            next_path = self.get_next_path(response)
+
+    def get_path_recursively(self, path):
+        value = []
+        for page in self.iter_pages(path):
+            value.extend(page)
 
         return value
 
@@ -172,14 +513,14 @@ class GithubUser(Resource):
         return self.endpoint.create(path, {"title": title, "key": key})
 
     @classmethod
-    def fetch_info(cls, token, skip_cache=False):
-        instance = cls.from_token(token)
-        response = instance.endpoint.retrieve('/user', skip_cache=skip_cache)
+    def fetch_info(cls, token, skip_cache=False, endpoint_class=GithubEndpoint):
+        instance = cls.from_token(token, endpoint_class)
+        retrieve = lambda path: instance.endpoint.retrieve(path, skip_cache=skip_cache)
+        response, response2 = instance.endpoint.imap(retrieve, ['/user', '/user/orgs'])
         if not response:
             return {}
 
         user_info = json.loads(response['response_data'])
-        response2 = instance.endpoint.retrieve('/user/orgs', skip_cache=skip_cache)
         if response2:
             orgs = json.loads(response2['response_data'])
             user_info['organizations'] = [o for o in orgs if 'coderwall' not in o['login']]
@@ -196,12 +537,27 @@ class GithubUser(Resource):
         path = '/users/{0}/repos?sort=pushed'.format(username)
         return self.get_path_recursively(path)
 
+    def iter_repositories(self, username):
+        path = '/users/{0}/repos?sort=pushed'.format(username)
+        for page in self.iter_pages(path):
+            for repository in page:
+                yield repository
+
 
 class GithubOrganization(Resource):
     def get_repositories(self, name):
         path = '/orgs/{0}/repos?sort=pushed'.format(name)
         return self.get_path_recursively(path)
 
+    def iter_repository_pages(self, name):
+        path = '/orgs/{0}/repos?sort=pushed'.format(name)
+        return self.iter_pages(path)
+
+    def iter_repositories(self, name):
+        for page in self.iter_repository_pages(name):
+            for repository in page:
+                yield repository
+
 
 class GithubRepository(Resource):
     def get(self, owner, project):
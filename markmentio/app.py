@@ -8,7 +8,7 @@ import pickle
 
 from datetime import timedelta, datetime
 from uuid import uuid4
-from redis import StrictRedis
+from markmentio.redispool import get_redis, SESSIONS
 from werkzeug.datastructures import CallbackDict
 from flask.sessions import SessionInterface, SessionMixin
 
@@ -67,7 +67,7 @@ class RedisSessionInterface(SessionInterface):
 
     def __init__(self, redis=None, prefix='session:'):
         if redis is None:
-            redis = StrictRedis(db=2)
+            redis = get_redis(SESSIONS)
 
         self.redis = redis
         self.prefix = prefix
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import sys
+import time
+
+from threading import RLock, Event, Thread
+from collections import OrderedDict, defaultdict
+
+from markmentio import settings
+
+
+class CacheStats(object):
+    """Counts hits and misses of each cache tier"""
+    def __init__(self):
+        self.lock = RLock()
+        self.counters = defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+    def hit(self, tier):
+        with self.lock:
+            self.counters[tier]['hits'] += 1
+
+    def miss(self, tier):
+        with self.lock:
+            self.counters[tier]['misses'] += 1
+
+    def to_dict(self):
+        with self.lock:
+            result = {}
+            for tier, counter in self.counters.items():
+                total = counter['hits'] + counter['misses']
+                result[tier] = dict(counter, hit_rate=total and float(counter['hits']) / total or 0.0)
+
+            return result
+
+
+class LRUCache(object):
+    """A small in-process cache that keeps up to `max_entries` values,
+    adding up to `max_bytes`, for no longer than `ttl` seconds. The
+    least recently used values are dropped first."""
+    def __init__(self, max_entries, ttl, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes or float('inf')
+        self.ttl = ttl
+        self.lock = RLock()
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return None
+
+            expires_at, size, value = entry
+            if expires_at <= time.time():
+                self.size -= size
+                return None
+
+            # back to the most recently used end
+            self.entries[key] = entry
+            return value
+
+    def set(self, key, value, expires_at=None, size=0):
+        if size > self.max_bytes:
+            return
+
+        expires_at = min(expires_at or float('inf'), time.time() + self.ttl)
+        with self.lock:
+            self.delete(key)
+            self.entries[key] = (expires_at, size, value)
+            self.size += size
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                _, (_, evicted_size, _) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def delete(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry[1]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SingleFlight(object):
+    """Coalesces concurrent calls sharing the same key: the first caller
+    runs the function while the others wait for it, and they all get its
+    result back (or its exception raised)."""
+    def __init__(self):
+        self.lock = RLock()
+        self.calls = {}
+
+    def join(self, key):
+        """Returns the call in flight for `key`, and whether it was just
+        created, in which case the caller has to run it."""
+        with self.lock:
+            call = self.calls.get(key)
+            if call is not None:
+                return call, False
+
+            call = self.calls[key] = {'done': Event(), 'outcome': None}
+            return call, True
+
+    def run(self, key, call, function):
+        try:
+            call['outcome'] = (True, function())
+        except Exception:
+            call['outcome'] = (False, sys.exc_info())
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call['done'].set()
+
+    def do(self, key, function):
+        while True:
+            call, leader = self.join(key)
+            if leader:
+                self.run(key, call, function)
+            else:
+                call['done'].wait()
+
+            # a leader killed halfway (say by gevent.killall) leaves no
+            # outcome behind, one of the callers that waited runs it again
+            if call['outcome'] is not None:
+                break
+
+        succeeded, value = call['outcome']
+        if not succeeded:
+            raise value[0], value[1], value[2]
+
+        return value
+
+    def do_in_background(self, key, function):
+        """Runs `function` in a background thread (a greenlet once gevent
+        patched the process) unless a call for `key` is already in
+        flight. Returns whether it was started."""
+        call, leader = self.join(key)
+        if leader:
+            worker = Thread(target=self.run, args=(key, call, function))
+            worker.daemon = True
+            worker.start()
+
+        return leader
+
+
+stats = CacheStats()
+in_flight = SingleFlight()
+
+_local_cache = None
+_local_cache_lock = RLock()
+
+
+def get_local_cache():
+    """Returns the in-process tier of the API cache, or None when it is
+    disabled by setting `API_LOCAL_CACHE_SIZE` to 0."""
+    global _local_cache
+    if not settings.API_LOCAL_CACHE_SIZE:
+        return None
+
+    with _local_cache_lock:
+        if _local_cache is None:
+            _local_cache = LRUCache(settings.API_LOCAL_CACHE_SIZE, settings.API_LOCAL_CACHE_TTL,
+                                    settings.API_LOCAL_CACHE_MAX_BYTES)
+
+    return _local_cache
@@ -7,7 +7,7 @@ import json
 
 from flask.ext.script import Command
 from flask.ext.script import Option
-from redis import StrictRedis
+from markmentio.redispool import get_redis
 
 LOGO = '''
                                             888
@@ -30,34 +30,79 @@ LOGO = '''
 '''
 
 
+# the latest build pushed for each repository that was being built at
+# the time, keyed by its full name, waiting for that build to be done
+PENDING_BUILDS = "markmentio:builds:pending"
+
+
+def build_name(build):
+    return "{owner[name]}/{name}".format(**build['repository'])
+
+
 class RunWorkers(Command):
+    def next_build(self, redis, building):
+        """Returns the next build whose repository is not being built
+        already, so that the builds of a repository never overlap.
+
+        The others wait in redis, and only the latest one of each
+        repository is kept, since it fetches the same HEAD as the ones
+        it replaces would."""
+        for full_name, raw in redis.hgetall(PENDING_BUILDS).items():
+            if full_name not in building and redis.hdel(PENDING_BUILDS, full_name):
+                return json.loads(raw)
+
+        while True:
+            next_build_raw = redis.lpop("yipidocs:builds")
+            if not next_build_raw:
+                return None
+
+            build = json.loads(next_build_raw)
+            if build_name(build) not in building:
+                return build
+
+            redis.hset(PENDING_BUILDS, build_name(build), next_build_raw)
+
     def run(self):
-        redis = StrictRedis()
+        redis = get_redis()
+        from markmentio import settings
+        from markmentio.ready import mark_ready, was_built
         from markmentio.workers.manager import DocumentationGenerator
+        from markmentio.workers.workspaces import get_workspace_manager
 
-        workers = DocumentationGenerator()
+        workspaces = get_workspace_manager()
+        workers = DocumentationGenerator(settings.BUILD_CONCURRENCY)
+        # full names of the repositories being built
+        building = set()
         print "Waiting for a build..."
 
         while workers.are_running():
-            next_build_raw = redis.lpop("yipidocs:builds")
-            if not next_build_raw:
+            while len(building) < settings.BUILD_CONCURRENCY:
+                build = self.next_build(redis, building)
+                if not build:
+                    break
+
+                workers.feed(build)
+                building.add(build_name(build))
+
+            if not building:
                 time.sleep(3)
                 continue
 
-            next_build = json.loads(next_build_raw)
-
-            workers.feed(next_build)
             payload = workers.wait_and_get_work()
+            building.discard(build_name(payload))
+            if payload.get('workspace'):
+                workspaces.release(payload['workspace'])
+
             if 'error' in payload:
                 print "Failed", payload
                 sys.stderr.write(payload['error'])
                 continue
 
-            repository = payload['repository']
-            owner = repository['owner']['name']
-            serialized_payload = json.dumps(payload)
-            full_name = "{owner[name]}/{name}".format(**repository)
-            redis.hset("markmentio:ready", full_name, serialized_payload)
+            if not was_built(payload):
+                print "Nothing was built", payload
+                continue
+
+            full_name = mark_ready(redis, payload)
             redis.rpush("markmentio:notifications", json.dumps({
                 'message': 'Documentation ready: {0}'.format(full_name)
             }))
@@ -68,7 +113,7 @@ class EnqueueProject(Command):
     def run(self):
         from markmentio.models import User
         from markmentio import db
-        redis = StrictRedis()
+        redis = get_redis()
         users = User.using(db.engine).all()
         if not users:
             print ("Run the server and log in with github, "
@@ -79,7 +124,6 @@ class EnqueueProject(Command):
 
         redis.rpush("yipidocs:builds", json.dumps({
             'token': user.github_token,
-            'clone_path': '/tmp/YIPIT_DOCS',
             'repository': {
                 'name': 'yipit-client',
                 'owner': {
@@ -89,6 +133,20 @@ class EnqueueProject(Command):
         }))
 
 
+class IndexReadyDocs(Command):
+    def run(self):
+        from markmentio.ready import migrate
+        redis = get_redis()
+        print "Moved {0} builds to the per owner index".format(migrate(redis))
+
+
+class IndexHooks(Command):
+    def run(self):
+        from markmentio.hooks import migrate
+        redis = get_redis()
+        print "Moved {0} hooks to the per owner index".format(migrate(redis))
+
+
 class Check(Command):
     def run(self):
         from markmentio.app import App
@@ -110,4 +168,6 @@ def init_command_manager(manager):
     manager.add_command('enqueue', EnqueueProject())
     manager.add_command('check', Check())
     manager.add_command('workers', RunWorkers())
+    manager.add_command('index_ready_docs', IndexReadyDocs())
+    manager.add_command('index_hooks', IndexHooks())
     return manager
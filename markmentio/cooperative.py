@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import deque
+from itertools import islice
+from threading import RLock
+
+import gevent
+from gevent.coros import BoundedSemaphore
+
+from markmentio import settings
+from markmentio.api import GithubEndpoint
+from markmentio.ratelimit import INTERACTIVE
+
+_semaphore = None
+_semaphore_lock = RLock()
+
+
+def get_api_semaphore():
+    """Returns the semaphore capping how many github calls the greenlets
+    of this process may have in flight at the same time."""
+    global _semaphore
+    with _semaphore_lock:
+        if _semaphore is None:
+            _semaphore = BoundedSemaphore(settings.API_COOPERATIVE_CONCURRENCY)
+
+    return _semaphore
+
+
+def cooperative_imap(function, items, fan_out):
+    """Yields `function(item)` for each one of the items, in order,
+    running up to `fan_out` of them at once, each on its own greenlet.
+    The first error is re-raised once its turn to be yielded comes."""
+    items = iter(items)
+    running = deque(gevent.spawn(function, item) for item in islice(items, fan_out))
+    try:
+        while running:
+            value = running.popleft().get()
+            for item in islice(items, 1):
+                running.append(gevent.spawn(function, item))
+
+            yield value
+    finally:
+        # nobody is waiting for the rest anymore
+        gevent.killall(list(running))
+
+
+class CooperativeGithubEndpoint(GithubEndpoint):
+    """A `GithubEndpoint` meant for the gevent web server.
+
+    Fan-outs run on greenlets instead of threads, up to `fan_out` of
+    them per call (`API_COOPERATIVE_FAN_OUT` by default): the user info
+    and the organizations at login, and the pages of the repositories
+    streamed to the dashboard. The calls to github of the whole process
+    are capped at `API_COOPERATIVE_CONCURRENCY`, so that one dashboard
+    cannot starve the others.
+
+    The sockets of `requests` and `redis` yield to the hub because the
+    gevent worker monkey patches them, this class adds no thread of its
+    own.
+    """
+    def __init__(self, token, public=False, priority=INTERACTIVE, fan_out=None):
+        super(CooperativeGithubEndpoint, self).__init__(token, public, priority)
+        self.semaphore = get_api_semaphore()
+        self.fan_out = fan_out or settings.API_COOPERATIVE_FAN_OUT
+
+    def get_from_web(self, path, headers, data=None):
+        with self.semaphore:
+            return super(CooperativeGithubEndpoint, self).get_from_web(path, headers, data)
+
+    def post(self, path, headers, data=None):
+        with self.semaphore:
+            return super(CooperativeGithubEndpoint, self).post(path, headers, data)
+
+    def stream(self, path, headers=None):
+        with self.semaphore:
+            return super(CooperativeGithubEndpoint, self).stream(path, headers)
+
+    def imap(self, function, items):
+        return cooperative_imap(function, items, self.fan_out)
@@ -7,11 +7,31 @@ from markmentio import settings
 from markmentio.log import logger
 
 
-def user_is_authenticated():
-    from markmentio import settings
+def remember_user(user):
+    """Keeps the row of the logged in user in the session, so the next
+    requests can resolve it without going to the database"""
+    session['user'] = user.to_dict()
+
+
+def get_session_user(data):
+    """Returns the user of the github user `data`, from the session when
+    it is still up to date, from the database otherwise"""
+    from markmentio.db import engine
     from markmentio.models import User
+    cached = session.get('user')
+    if cached and cached.get('username') == data.get('login'):
+        user = User(engine=engine, **cached)
+        if not user.is_outdated(data):
+            return user
+
+    user = User.get_or_create_from_github_user(data)
+    remember_user(user)
+    return user
+
+
+def user_is_authenticated():
     data = session.get('github_user_data', False)
-    if data:
-        g.user = User.get_or_create_from_github_user(data)
+    if data and getattr(g, 'user', None) is None:
+        g.user = get_session_user(data)
 
     return data and data['login']
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+
+# one hash per owner, mapping each repository with a hook to its record
+HOOKS_KEY = "markmentio:hooks:{0}"
+# the full names of the repositories of an owner that have a hook
+TRACKED_KEY = "markmentio:tracked:{0}"
+# where every hook used to be stored, read by `migrate` only
+LEGACY_HOOKS_KEY = "markmentio:hooks"
+
+
+def save_hook(redis, owner, full_name, record):
+    owner = owner.lower()
+    pipe = redis.pipeline()
+    pipe.hset(HOOKS_KEY.format(owner), full_name, json.dumps(record))
+    pipe.sadd(TRACKED_KEY.format(owner), full_name)
+    pipe.execute()
+
+
+def get_tracked_repositories(redis, owner):
+    """Returns the full names of the repositories of `owner` that have a hook"""
+    return redis.smembers(TRACKED_KEY.format(owner.lower()))
+
+
+def get_hooks(redis, owner, full_names):
+    """Returns the hook records of the given repositories of `owner`,
+    keyed by full name, leaving out the ones without a hook."""
+    full_names = list(full_names)
+    if not full_names:
+        return {}
+
+    records = redis.hmget(HOOKS_KEY.format(owner.lower()), full_names)
+    return dict([(name, json.loads(record)) for name, record in zip(full_names, records) if record])
+
+
+def migrate(redis):
+    """Moves the hooks stored in the legacy global hash to the per
+    owner ones, returning how many were moved."""
+    moved = 0
+    for full_name, record in redis.hgetall(LEGACY_HOOKS_KEY).items():
+        owner = full_name.split('/', 1)[0]
+        save_hook(redis, owner, full_name, json.loads(record))
+        redis.hdel(LEGACY_HOOKS_KEY, full_name)
+        moved += 1
+
+    return moved
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+import logging
+import requests
+
+from threading import RLock
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout
+from requests.packages.urllib3.poolmanager import PoolManager
+
+from markmentio import settings
+
+log = logging.getLogger('markmentio.api')
+
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')
+
+
+class PoolAdapter(HTTPAdapter):
+    """An `HTTPAdapter` whose pools can block when they run out of
+    connections, rather than opening throwaway ones."""
+    def __init__(self, pool_connections, pool_maxsize, block=False):
+        self.block = block
+        super(PoolAdapter, self).__init__(pool_connections, pool_maxsize)
+
+    def init_poolmanager(self, connections, maxsize):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self.poolmanager = PoolManager(num_pools=connections, maxsize=maxsize, block=self.block)
+
+
+class PooledSession(object):
+    """A keep-alive `requests` session shared by the whole process.
+
+    Connections are pooled per host: up to `pool_size` hosts are kept
+    around, with up to `per_host` connections each. When `block` is
+    set, callers wait for a free connection instead of opening extra
+    ones, which caps the connections held against any single host.
+
+    Idempotent requests that fail to connect or get a 5xx back are
+    retried up to `retries` times, waiting `backoff` seconds before
+    the first retry and twice as long before each following one.
+    """
+    def __init__(self, pool_size, per_host, block=False, retries=0, backoff=0.2, timeout=None):
+        self.adapter = PoolAdapter(pool_size, per_host, block)
+        self.session = requests.Session()
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.total_retries = 0
+
+    def request(self, method, url, **kw):
+        kw.setdefault('timeout', self.timeout)
+        can_retry = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+
+        while True:
+            try:
+                response = self.session.request(method, url, **kw)
+            except (ConnectionError, Timeout):
+                if not can_retry or attempt >= self.retries:
+                    raise
+
+                log.warning("Failed to %s %s, retrying", method, url)
+            else:
+                if response.status_code < 500 or not can_retry or attempt >= self.retries:
+                    return response
+
+                log.warning("%s %s replied %s, retrying", method, url, response.status_code)
+                response.close()
+
+            time.sleep(self.backoff * (2 ** attempt))
+            attempt += 1
+            self.total_retries += 1
+
+    def get(self, url, **kw):
+        return self.request('GET', url, **kw)
+
+    def post(self, url, **kw):
+        return self.request('POST', url, **kw)
+
+    def put(self, url, **kw):
+        return self.request('PUT', url, **kw)
+
+    def stats(self):
+        """Returns how many connections were opened and how many times
+        an already open connection was reused, across every pool."""
+        pools = self.adapter.poolmanager.pools
+        opened = requested = 0
+        for key in pools.keys():
+            try:
+                pool = pools[key]
+            except KeyError:
+                continue
+
+            opened += pool.num_connections
+            requested += pool.num_requests
+
+        return {
+            'pools': len(pools),
+            'requests': requested,
+            'connections_opened': opened,
+            'connections_reused': max(requested - opened, 0),
+            'retries': self.total_retries,
+        }
+
+
+_session = None
+_session_lock = RLock()
+
+
+def get_http_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = PooledSession(
+                pool_size=settings.HTTP_POOL_CONNECTIONS,
+                per_host=settings.HTTP_POOL_MAXSIZE,
+                block=settings.HTTP_POOL_BLOCK,
+                retries=settings.HTTP_RETRIES,
+                backoff=settings.HTTP_RETRY_BACKOFF / 1000.0,
+                timeout=settings.HTTP_TIMEOUT,
+            )
+
+    return _session
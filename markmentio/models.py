@@ -51,6 +51,12 @@ class User(Model):
     def list_repositories(self):
         return self.api.get_repositories(self.username)
 
+    def is_outdated(self, data):
+        """Tells whether the github token or the email in the github
+        user `data` differ from the stored ones"""
+        return (self.github_token != data.get('github_token') or
+                self.email != (data.get('email') or self.email))
+
     @classmethod
     def create_from_github_user(cls, data):
         login = data.get('login')
@@ -75,9 +81,9 @@ class User(Model):
 
         if not instance:
             instance = cls.create_from_github_user(data)
-        else:
+        elif instance.is_outdated(data):
             instance.github_token = data.get('github_token')
-            instance.email = data.get('email', instance.email)
+            instance.email = data.get('email') or instance.email
             instance.save()
 
         return instance
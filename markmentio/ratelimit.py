@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+import hashlib
+import logging
+
+from markmentio import settings
+
+log = logging.getLogger('markmentio.api')
+
+INTERACTIVE = 'interactive'
+BUILD = 'build'
+
+# claims the next free slot of a paced token, atomically so that every
+# web and worker process sharing the token takes turns
+CLAIM_SLOT = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local next_at = tonumber(redis.call('HGET', KEYS[1], 'next_at') or '0')
+if next_at < now then
+    next_at = now
+end
+redis.call('HSET', KEYS[1], 'next_at', tostring(next_at + interval))
+return tostring(next_at)
+"""
+
+
+class RateLimitBudget(object):
+    """Keeps track of what is left of a token's github rate limit.
+
+    The `X-RateLimit-Remaining` and `X-RateLimit-Reset` headers of every
+    reply are recorded in redis, so every process using the token shares
+    the same view of it. Before each call, `wait` defers it as needed:
+
+    * build calls leave `RATELIMIT_RESERVE` calls untouched for the
+      dashboard, and are paced evenly until the reset once fewer than
+      `RATELIMIT_PACING_THRESHOLD` calls are left above that reserve.
+
+    * interactive calls only wait when the budget is gone, and never
+      for longer than `RATELIMIT_INTERACTIVE_MAX_WAIT` seconds.
+    """
+    def __init__(self, redis, token):
+        self.redis = redis
+        self.key = "ratelimit:token:{0}".format(hashlib.sha1(token or '').hexdigest())
+
+    def record(self, headers):
+        headers = dict((k.lower(), v) for k, v in headers.items())
+        remaining = headers.get('x-ratelimit-remaining')
+        reset = headers.get('x-ratelimit-reset')
+        if remaining is None or reset is None:
+            return
+
+        pipe = self.redis.pipeline()
+        pipe.hmset(self.key, {'remaining': remaining, 'reset': reset})
+        pipe.expireat(self.key, int(reset) + 60)
+        pipe.execute()
+
+    def get(self):
+        remaining, reset = self.redis.hmget(self.key, 'remaining', 'reset')
+        if remaining is None or reset is None:
+            return None, None
+
+        return int(remaining), int(reset)
+
+    def wait(self, priority=INTERACTIVE):
+        remaining, reset = self.get()
+        now = time.time()
+        if remaining is None or reset <= now:
+            return
+
+        if priority == BUILD:
+            spare = remaining - settings.RATELIMIT_RESERVE
+            if spare <= 0:
+                log.warning("Deferring build call for %d seconds until the rate limit resets", reset - now)
+                time.sleep(reset - now + 1)
+                return
+
+            if spare < settings.RATELIMIT_PACING_THRESHOLD:
+                interval = (reset - now) / float(spare)
+                slot = float(self.redis.eval(CLAIM_SLOT, 1, self.key, repr(now), repr(interval)))
+                if slot > now:
+                    time.sleep(slot - now)
+
+        elif remaining <= 0:
+            delay = min(reset - now + 1, settings.RATELIMIT_INTERACTIVE_MAX_WAIT)
+            log.warning("Rate limit exhausted, deferring call for %d seconds", delay)
+            time.sleep(delay)
+
+        self.redis.hincrby(self.key, 'remaining', -1)
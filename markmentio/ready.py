@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+from datetime import datetime
+
+# one hash per owner, mapping each of its repositories with ready docs
+# to a short summary of the last build
+READY_KEY = "markmentio:ready:{0}"
+# the full list of files uploaded by the last build of a repository
+INDEX_KEY = "markmentio:index:{0}"
+# where every build used to be stored as a whole, read by `migrate` only
+LEGACY_READY_KEY = "markmentio:ready"
+
+
+def summarize(payload):
+    """Returns the compact record the dashboard needs about a build"""
+    return {
+        'url': payload['bucket']['url'],
+        'built_at': payload.get('built_at') or datetime.utcnow().isoformat(),
+        'commit': payload.get('commit'),
+    }
+
+
+def was_built(payload):
+    """Whether the payload is that of a build which got uploaded, failed
+    ones have neither a bucket nor anything else to be recorded."""
+    return payload.get('success', True) and 'bucket' in payload
+
+
+def mark_ready(redis, payload):
+    """Records the documentation built for a repository: its summary
+    under its owner, and its file index on the side."""
+    repository = payload['repository']
+    owner = repository['owner']['name']
+    full_name = "{0}/{1}".format(owner, repository['name'])
+
+    pipe = redis.pipeline()
+    pipe.hset(READY_KEY.format(owner.lower()), full_name, json.dumps(summarize(payload)))
+    pipe.set(INDEX_KEY.format(full_name.lower()), json.dumps(payload.get('index', [])))
+    pipe.execute()
+    return full_name
+
+
+def get_ready_docs(redis, owners):
+    """Returns the summaries of the ready docs of the given owners,
+    keyed by the full name of their repositories."""
+    owners = list(owners)
+    pipe = redis.pipeline(transaction=False)
+    for owner in owners:
+        pipe.hgetall(READY_KEY.format(owner.lower()))
+
+    docs = {}
+    for found in pipe.execute():
+        for full_name, summary in found.items():
+            docs[full_name] = json.loads(summary)
+
+    return docs
+
+
+def get_ready_index(redis, full_name):
+    """Returns the files uploaded by the last build of a repository"""
+    index = redis.get(INDEX_KEY.format(full_name.lower()))
+    return index and json.loads(index) or []
+
+
+def migrate(redis):
+    """Moves the builds stored in the legacy global hash to the per
+    owner index, returning how many were moved. Failed builds have
+    nothing to be moved and are just dropped."""
+    moved = 0
+    for full_name, payload in redis.hgetall(LEGACY_READY_KEY).items():
+        payload = json.loads(payload)
+        if was_built(payload):
+            mark_ready(redis, payload)
+            moved += 1
+
+        redis.hdel(LEGACY_READY_KEY, full_name)
+
+    return moved
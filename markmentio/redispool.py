@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from urlparse import urlparse
+from threading import RLock
+
+from redis import StrictRedis, BlockingConnectionPool
+
+from markmentio import settings
+
+# the logical databases, each one with its own pool
+QUEUES = 'queues'
+CACHE = 'cache'
+SESSIONS = 'sessions'
+
+
+class RedisPools(object):
+    """Hands out redis clients that share one connection pool per
+    logical database of the server at `uri`.
+
+    Each pool holds up to `max_connections` connections. Once they are
+    all in use, callers wait up to `timeout` seconds for one to be
+    released instead of opening more.
+    """
+    def __init__(self, uri, databases, max_connections, timeout=None, socket_timeout=None):
+        parsed = urlparse(uri)
+        self.connection_kwargs = {
+            'host': parsed.hostname or 'localhost',
+            'port': parsed.port or 6379,
+            'password': parsed.password,
+            'socket_timeout': socket_timeout,
+        }
+        self.databases = databases
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.lock = RLock()
+        self.pools = {}
+
+    def pool(self, name):
+        with self.lock:
+            if name not in self.pools:
+                self.pools[name] = BlockingConnectionPool(
+                    max_connections=self.max_connections,
+                    timeout=self.timeout,
+                    db=self.databases[name],
+                    **self.connection_kwargs
+                )
+
+            return self.pools[name]
+
+    def get(self, name):
+        return StrictRedis(connection_pool=self.pool(name))
+
+    def stats(self):
+        """Returns how many connections each pool opened, and how many
+        of them are in use right now."""
+        result = {}
+        with self.lock:
+            pools = self.pools.items()
+
+        for name, pool in pools:
+            opened = len(pool._connections)
+            idle = len([c for c in list(pool.pool.queue) if c is not None])
+            result[name] = {
+                'db': self.databases[name],
+                'max_connections': pool.max_connections,
+                'connections_opened': opened,
+                'connections_in_use': opened - idle,
+            }
+
+        return result
+
+
+_pools = None
+_pools_lock = RLock()
+
+
+def get_redis_pools():
+    global _pools
+    with _pools_lock:
+        if _pools is None:
+            _pools = RedisPools(
+                settings.REDIS_URI,
+                databases={
+                    QUEUES: settings.REDIS_QUEUES_DB,
+                    CACHE: settings.REDIS_CACHE_DB,
+                    SESSIONS: settings.REDIS_SESSIONS_DB,
+                },
+                max_connections=settings.REDIS_MAX_CONNECTIONS,
+                timeout=settings.REDIS_POOL_TIMEOUT,
+                socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            )
+
+    return _pools
+
+
+def get_redis(name=QUEUES):
+    """Returns a client of the logical database `name`, backed by the
+    connection pool the whole process shares for it."""
+    return get_redis_pools().get(name)
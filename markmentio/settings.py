@@ -52,7 +52,18 @@ RELEASE = env.get('RELEASE', uuid4().hex)
 # Session key, CHANGE IT IF YOU GET TO THE PRODUCTION! :)
 SECRET_KEY = RELEASE + '%F&G*&H(*ds3657d468f57g68h'
 
-REDIS_URI = env.get_uri("REDIS_URI")
+REDIS_URI = env.get("REDIS_URI", "redis://localhost:6379")
+
+# logical databases of the redis server at REDIS_URI
+REDIS_QUEUES_DB = env.get_int('REDIS_QUEUES_DB', 0)
+REDIS_CACHE_DB = env.get_int('REDIS_CACHE_DB', 1)
+REDIS_SESSIONS_DB = env.get_int('REDIS_SESSIONS_DB', 2)
+
+# connections each database pool may open, how long callers wait for
+# one once they are all in use, and the socket timeout (0 for none)
+REDIS_MAX_CONNECTIONS = env.get_int('REDIS_MAX_CONNECTIONS', 50)
+REDIS_POOL_TIMEOUT = env.get_int('REDIS_POOL_TIMEOUT', 20)
+REDIS_SOCKET_TIMEOUT = env.get_int('REDIS_SOCKET_TIMEOUT', 10) or None
 
 AUTH_USER = env.get("AUTH_USER", "")
 AUTH_PASSWD = env.get("AUTH_PASSWD", "")
@@ -61,3 +72,82 @@ absurl = lambda *path: "{0}{1}/{2}".format(SCHEMA, DOMAIN, "/".join(path).lstrip
 SSH_PUBLIC_KEY_PATH = expanduser("~/.ssh/id_rsa.pub")
 SSH_PUBLIC_KEY = open(SSH_PUBLIC_KEY_PATH).read()
 DEFAULT_THEME_PATH = LOCAL_FILE('default_theme')
+
+# HTTP connections kept alive to up to POOL_CONNECTIONS hosts, with up
+# to POOL_MAXSIZE connections each, blocking for a free one if POOL_BLOCK
+HTTP_POOL_CONNECTIONS = env.get_int('HTTP_POOL_CONNECTIONS', 10)
+HTTP_POOL_MAXSIZE = env.get_int('HTTP_POOL_MAXSIZE', 20)
+HTTP_POOL_BLOCK = bool(env.get_int('HTTP_POOL_BLOCK', 0))
+HTTP_RETRIES = env.get_int('HTTP_RETRIES', 3)
+HTTP_RETRY_BACKOFF = env.get_int('HTTP_RETRY_BACKOFF', 200)  # milliseconds
+HTTP_TIMEOUT = env.get_int('HTTP_TIMEOUT', 30)
+
+# how long cached github responses are fresh, pushes received by the
+# webhook invalidate the ones of the repository and of its owner
+API_CACHE_TIMEOUT = env.get_int('API_CACHE_TIMEOUT', 60 * 30)
+
+# pages of a github listing fetched at the same time
+API_PAGINATION_FAN_OUT = env.get_int('API_PAGINATION_FAN_OUT', 4)
+
+# greenlet based github calls of the web server: how many a single
+# fan-out runs at once, and how many the whole process has in flight
+API_COOPERATIVE_FAN_OUT = env.get_int('API_COOPERATIVE_FAN_OUT', 8)
+API_COOPERATIVE_CONCURRENCY = env.get_int('API_COOPERATIVE_CONCURRENCY', 20)
+
+# in-process tier in front of the redis cache of github responses,
+# set its size to 0 to disable it
+API_LOCAL_CACHE_SIZE = env.get_int('API_LOCAL_CACHE_SIZE', 512)
+API_LOCAL_CACHE_TTL = env.get_int('API_LOCAL_CACHE_TTL', 30)
+API_LOCAL_CACHE_MAX_BYTES = env.get_int('API_LOCAL_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+
+# seconds past their expiry during which cached github responses are
+# still served while being refreshed in the background, 0 disables it
+API_CACHE_STALE_TIMEOUT = env.get_int('API_CACHE_STALE_TIMEOUT', 60 * 60)
+
+# github calls left to the dashboard by builds, how many calls above
+# that reserve start pacing builds, and how long the dashboard may wait
+RATELIMIT_RESERVE = env.get_int('RATELIMIT_RESERVE', 500)
+RATELIMIT_PACING_THRESHOLD = env.get_int('RATELIMIT_PACING_THRESHOLD', 1000)
+RATELIMIT_INTERACTIVE_MAX_WAIT = env.get_int('RATELIMIT_INTERACTIVE_MAX_WAIT', 5)
+
+# Builds processed at the same time, each one in its own workspace
+# limited to WORKSPACE_QUOTA bytes
+BUILD_CONCURRENCY = env.get_int('BUILD_CONCURRENCY', 2)
+WORKSPACE_ROOT = env.get('WORKSPACE_ROOT', '/tmp/markmentio/workspaces')
+WORKSPACE_QUOTA = env.get_int('WORKSPACE_QUOTA', 512 * 1024 * 1024)
+
+# Build logs are pushed to redis in batches of up to LOG_SINK_MAX_SIZE
+# messages, waiting no longer than LOG_SINK_MAX_DELAY seconds
+LOG_SINK_MAX_SIZE = env.get_int('LOG_SINK_MAX_SIZE', 200)
+LOG_SINK_MAX_DELAY = env.get_int('LOG_SINK_MAX_DELAY', 1)
+
+# Downloader workers
+DOWNLOADER_RECURSIVE_TREE = bool(env.get_int('DOWNLOADER_RECURSIVE_TREE', 1))
+# threads shared by every build, and how many of them a single build may use
+DOWNLOADER_POOL_SIZE = env.get_int('DOWNLOADER_POOL_SIZE', 16)
+DOWNLOADER_BUILD_CONCURRENCY = env.get_int('DOWNLOADER_BUILD_CONCURRENCY', 8)
+# content-addressed blobs shared across builds, set the path empty to disable it
+BLOB_STORE_PATH = env.get('BLOB_STORE_PATH', '/tmp/markmentio/blobs')
+BLOB_STORE_MAX_SIZE = env.get_int('BLOB_STORE_MAX_SIZE', 1024 * 1024 * 1024)
+# persistent per-repository checkouts that are synced incrementally
+DOWNLOADER_INCREMENTAL = bool(env.get_int('DOWNLOADER_INCREMENTAL', 1))
+SYNC_ROOT = env.get('SYNC_ROOT', '/tmp/markmentio/sync')
+# "api" fetches blob by blob, "archive" downloads a tarball, "git" keeps
+# a local mirror and "auto" picks between the api and the archive,
+# which is used for repositories with at least ARCHIVE_MIN_FILES
+DOWNLOADER_STRATEGY = env.get('DOWNLOADER_STRATEGY', 'auto')
+DOWNLOADER_ARCHIVE_MIN_FILES = env.get_int('DOWNLOADER_ARCHIVE_MIN_FILES', 1000)
+# download blobs as raw media, written to disk in chunks of CHUNK_SIZE bytes
+DOWNLOADER_STREAM_BLOBS = bool(env.get_int('DOWNLOADER_STREAM_BLOBS', 1))
+DOWNLOADER_CHUNK_SIZE = env.get_int('DOWNLOADER_CHUNK_SIZE', 64 * 1024)
+# bare mirrors used by the "git" strategy, fetched DEPTH commits deep
+GIT_MIRROR_ROOT = env.get('GIT_MIRROR_ROOT', '/tmp/markmentio/mirrors')
+GIT_REMOTE_URL = env.get('GIT_REMOTE_URL', 'git@github.com:{owner}/{repository}.git')
+GIT_FETCH_DEPTH = env.get_int('GIT_FETCH_DEPTH', 1)
+# only fetch the markment projects and their themes
+DOWNLOADER_SPARSE = bool(env.get_int('DOWNLOADER_SPARSE', 0))
+SPARSE_EXTENSIONS = (
+    '.yml', '.md', '.markdown', '.html', '.css', '.js', '.json',
+    '.png', '.jpg', '.jpeg', '.gif', '.svg', '.ico', '.pdf',
+    '.eot', '.ttf', '.woff', '.otf',
+)
@@ -15,6 +15,7 @@ $(function(){
     var username = $("#socket-meta").data("username");
     var create_hook_ajax_url = $("#dashboard-meta").data("create-hook-ajax-url");
     var context_ajax_url = $("#dashboard-meta").data("context-ajax-url");
+    var context_stream_url = $("#dashboard-meta").data("context-stream-url");
     var modal_tracking_ajax_url = $("#dashboard-meta").data("modal-tracking-url");
     function get_modal_url(repository) {
         return modal_tracking_ajax_url.replace(username + "-PLACEHOLDER", repository.name)
@@ -22,6 +23,9 @@ $(function(){
     function get_context_ajax_url(owner_name) {
         return context_ajax_url.replace("PLACEHOLDER", owner_name);
     }
+    function get_context_stream_url(owner_name) {
+        return context_stream_url.replace("PLACEHOLDER", owner_name);
+    }
 
     var socket = io.connect(ADDRESS);
     var scope = angular.element($("body")).scope();
@@ -29,14 +33,83 @@ $(function(){
         return '<div class="uk-grid uk-text-center modal-loader"><div class="uk-width-1-1 " style="padding-top: 200px;%"><h2>loading...</h2><i class="uk-icon-'+icon_name+' uk-icon-large uk-icon-spin"></i></div></div>';
     }
 
+    function StreamLines (url, on_line, on_done, on_error) {
+        var xhr = new XMLHttpRequest();
+        var consumed = 0;
+        var failed = false;
+        function fail(error) {
+            if (!failed) {
+                failed = true;
+                on_error(error);
+            }
+        }
+        function consume() {
+            if (failed) {
+                return;
+            }
+            var end = xhr.responseText.lastIndexOf("\n");
+            if (end < consumed) {
+                return;
+            }
+            var lines = xhr.responseText.substring(consumed, end).split("\n");
+            consumed = end + 1;
+            $.each(lines, function(index, line){
+                if (!line) {
+                    return;
+                }
+                var item = JSON.parse(line);
+                // the server failed after the 200 was already sent
+                if (item.error) {
+                    fail(item.error);
+                    return false;
+                }
+                on_line(item);
+            });
+        }
+        xhr.onprogress = function(){
+            if (xhr.status === 200) {
+                consume();
+            }
+        };
+        xhr.onload = function(){
+            if (xhr.status !== 200) {
+                fail(xhr.statusText);
+                return;
+            }
+            consume();
+            if (!failed) {
+                on_done();
+            }
+        };
+        xhr.onerror = function(){
+            fail(xhr.statusText);
+        };
+        xhr.open("GET", url, true);
+        xhr.send();
+    };
     function SelectOrganizationTab (organization) {
-        $.getJSON(get_context_ajax_url(organization), function(data){
+        // called from ng-click, already within a digest
+        scope.repositories[organization] = [];
+        scope.repositories_by_name[organization] = {};
+        var tracked = 0;
+        StreamLines(get_context_stream_url(organization), function(repository){
             scope.$apply(function(){
-                scope.repositories[organization] = data.repositories;
-                scope.repositories_by_name[organization] = data.repositories_by_name;
-                console.log(scope.repositories);
+                var repositories = scope.repositories[organization];
+                if (repository.tracked) {
+                    // tracked ones go first, still in the order they came
+                    repositories.splice(tracked, 0, repository);
+                    tracked++;
+                } else {
+                    repositories.push(repository);
+                }
+                scope.repositories_by_name[organization][repository.full_name] = repository;
                 $(".ajax-loader."+organization).hide();
             });
+        }, function(){
+            $(".ajax-loader."+organization).hide();
+        }, function(){
+            $(".ajax-loader."+organization).hide();
+            humane.log("Failed to load the repositories of " + organization);
         });
     };
     function CreateHook (repository) {
@@ -20,12 +20,20 @@ from markmentio import settings
 from markmentio.api import (
     GithubUser,
     GithubOrganization,
+    invalidate_cache,
+    repository_tags,
 )
+from markmentio.cooperative import CooperativeGithubEndpoint
 from markmentio.handy.decorators import requires_login
+from markmentio.handy.functions import remember_user
+from markmentio.httppool import get_http_session
+from markmentio.cache import stats as cache_stats
+from markmentio.ready import get_ready_docs, get_ready_index
+from markmentio import hooks
 from markmentio.models import User
 from markmentio.log import logger
 from markmentio import db
-from redis import StrictRedis
+from markmentio.redispool import get_redis, get_redis_pools
 
 mod = Blueprint('views', __name__)
 
@@ -93,18 +101,19 @@ def index():
 @mod.route("/logout")
 def logout():
     session.pop('github_user_data', '')
+    session.pop('user', '')
     return redirect('/')
 
 
 @mod.route("/dashboard")
 @requires_login
 def dashboard():
-    redis = StrictRedis()
+    redis = get_redis()
 
-    organizations = session['github_user_data']['organizations']
-    docs_found = {}
-    for name, info in redis.hgetall('markmentio:ready').iteritems():
-        docs_found[name] = json.loads(info)
+    user_data = session['github_user_data']
+    organizations = user_data['organizations']
+    owners = [user_data['login']] + [org['login'] for org in organizations]
+    docs_found = get_ready_docs(redis, owners)
 
     return render_template('dashboard.html', organizations=organizations, docs_found=docs_found)
 
@@ -115,28 +124,47 @@ def email():
     return render_template('email/thankyou.html')
 
 
+def get_tracked_repositories(owner):
+    redis = get_redis()
+    try:
+        return hooks.get_tracked_repositories(redis, owner)
+    except Exception:
+        logger.exception("Failed to get the tracked repositories of %s", owner)
+        return set()
+
+
+def annotate_repositories(owner, repositories, tracked):
+    """Marks which repositories have a hook, fetching the hook records
+    of the tracked ones only."""
+    redis = get_redis()
+    names = [repo['full_name'] for repo in repositories if repo['full_name'] in tracked]
+    try:
+        records = hooks.get_hooks(redis, owner, names)
+    except Exception:
+        logger.exception("Failed to get the hooks of %s", owner)
+        records = {}
+
+    for repo in repositories:
+        full_name = repo['full_name']
+        repo['ready'] = records.get(full_name, False)
+        repo['not_ready'] = not repo['ready']
+        repo['tracked'] = full_name in tracked
+
+    return repositories
+
+
 @mod.route("/bin/dashboard/repo-list/<owner>.json")
 @requires_login
 def ajax_dashboard_repo_list(owner):
     token = session['github_token']
-    org = GithubOrganization.from_token(token)
-    redis = StrictRedis()
-    repositories_with_hooks = {}
-    try:
-        repositories_with_hooks = redis.hgetall("markmentio:hooks")
-    except Exception:
-        logger.exception("Failed to hgetall markmentio:hooks")
+    org = GithubOrganization.from_token(token, CooperativeGithubEndpoint)
+    tracked = get_tracked_repositories(owner)
 
-    all_repositories = org.get_repositories(owner)
     tracked_repositories = []
     untracked_repositories = []
 
-    for repo in all_repositories:
-        full_name = repo['full_name']
-        ready = json.loads(repositories_with_hooks.get(full_name, 'false'))
-        repo['ready'] = ready
-        repo['not_ready'] = not repo['ready']
-        if full_name in repositories_with_hooks:
+    for repo in annotate_repositories(owner, org.get_repositories(owner), tracked):
+        if repo['tracked']:
             tracked_repositories.append(repo)
         else:
             untracked_repositories.append(repo)
@@ -150,10 +178,49 @@ def ajax_dashboard_repo_list(owner):
     })
 
 
+@mod.route("/bin/dashboard/repo-list/<owner>.ndjson")
+@requires_login
+def ajax_dashboard_repo_stream(owner):
+    """Streams the repositories as newline-delimited JSON, one page at a
+    time as they come from github, instead of waiting for all of them."""
+    token = session['github_token']
+    org = GithubOrganization.from_token(token, CooperativeGithubEndpoint)
+    tracked = get_tracked_repositories(owner)
+
+    def generate():
+        try:
+            for page in org.iter_repository_pages(owner):
+                for repo in annotate_repositories(owner, page, tracked):
+                    yield json.dumps(repo) + "\n"
+        except Exception:
+            # too late for an error status, the client is told in band
+            logger.exception("Failed to stream the repositories of %s", owner)
+            yield json.dumps({'error': "Failed to list the repositories of {0}".format(owner)}) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+
+@mod.route("/bin/dashboard/docs/<owner>/<repository>/index.json")
+@requires_login
+def ajax_dashboard_docs_index(owner, repository):
+    """Lists the files uploaded by the last build of a repository that
+    belongs to the user or to one of their organizations."""
+    user_data = session['github_user_data']
+    owners = [user_data['login']] + [org['login'] for org in user_data['organizations']]
+    if owner.lower() not in [o.lower() for o in owners]:
+        return error_json_response("repository not found", 404)
+
+    full_name = "{0}/{1}".format(owner, repository)
+    return json_response({
+        'repository': full_name,
+        'index': get_ready_index(get_redis(), full_name),
+    })
+
+
 @mod.route("/bin/create/hook.json", methods=["POST"])
 @requires_login
 def create_hook():
-    redis = StrictRedis()
+    redis = get_redis()
     owner = request.form['repository[owner][login]']
     repository = request.form['repository[name]']
     full_name = request.form['repository[full_name]']
@@ -163,7 +230,7 @@ def create_hook():
         "user_md_token": user_md_token,
         "url": full_url_for(".webhook", owner=owner, repository=repository, md_token=user_md_token),
     }
-    redis.hset("markmentio:hooks", full_name, json.dumps(payload))
+    hooks.save_hook(redis, owner, full_name, payload)
     return json_response(payload)
 
 
@@ -178,13 +245,18 @@ def webhook(owner, repository, md_token):
         instructions = json.loads(request.form['payload'])
 
         instructions['token'] = user.github_token
-        instructions['clone_path'] = '/tmp/YIPIT_DOCS'
 
-        redis = StrictRedis()
+        redis = get_redis()
         redis.rpush("yipidocs:builds", json.dumps(instructions))
     except Exception as e:
         traceback.print_exc(e)
 
+    try:
+        invalidated = invalidate_cache(repository_tags(owner, repository))
+        logger.info("push to %s/%s invalidated %d cached github responses", owner, repository, invalidated)
+    except Exception:
+        logger.exception("Failed to invalidate the github cache of %s/%s", owner, repository)
+
     return json_response({'cool': True})
 
 
@@ -212,6 +284,15 @@ def ok():
     return Response('YES\n\r')
 
 
+@mod.route("/.stats")
+def stats():
+    return json_response({
+        'http': get_http_session().stats(),
+        'cache': cache_stats.to_dict(),
+        'redis': get_redis_pools().stats(),
+    })
+
+
 @mod.errorhandler(404)
 def page_not_found(e):
     return render_template('404.html'), 404
@@ -236,12 +317,13 @@ def github_callback(token):
 
     session['github_token'] = token
 
-    github_user_data = GithubUser.fetch_info(token, skip_cache=True)
+    github_user_data = GithubUser.fetch_info(token, skip_cache=True, endpoint_class=CooperativeGithubEndpoint)
 
     github_user_data['github_token'] = token
 
     g.user = User.get_or_create_from_github_user(github_user_data)
+    remember_user(g.user)
     session['github_user_data'] = github_user_data
-    gh_user = GithubUser.from_token(token)
+    gh_user = GithubUser.from_token(token, CooperativeGithubEndpoint)
     gh_user.install_ssh_key("markment-io", settings.SSH_PUBLIC_KEY)
     return redirect(next_url)
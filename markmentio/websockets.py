@@ -9,7 +9,7 @@ from gevent.coros import Semaphore
 from datetime import datetime
 from socketio.namespace import BaseNamespace
 from socketio.mixins import BroadcastMixin
-from redis import StrictRedis
+from markmentio.redispool import get_redis
 
 
 class Namespace(BaseNamespace):
@@ -25,7 +25,7 @@ class Namespace(BaseNamespace):
 
         return ''
 
-redis = StrictRedis()
+redis = get_redis()
 class MarkmentIOBroadcaster(Namespace, BroadcastMixin):
     def broadcast_status(self, text, error=None):
         traceback = self.format_exception(error)
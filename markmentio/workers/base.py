@@ -2,13 +2,12 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
-import json
 import sys
 import logging
 import traceback
 from pprint import pformat
 from threading import RLock, Thread
-from redis import StrictRedis
+from markmentio.workers.logsink import LogSink
 
 log = logging.getLogger('goloka:workers')
 
@@ -37,17 +36,17 @@ class Worker(Thread):
         self.produce_queue = produce_queue
         self.heart = Heart()
         self.daemon = False
+        self.log_sink = LogSink()
 
     def __str__(self):
         return '<{0}>'.format(self.__class__.__name__)
 
     def log(self, message, *args, **kw):
         with_redis = kw.get('with_redis', True)
-        redis = StrictRedis()
         msg = message % args
         log.info(message, *args)
         if with_redis:
-            redis.rpush("markmentio:logs", json.dumps({'message': msg}))
+            self.log_sink.push(msg)
 
     def consume(self, instructions):
         raise NotImplemented("You must implement the consume method by yourself")
@@ -73,6 +72,7 @@ class Worker(Thread):
             self.before_consume()
             instructions = self.consume_queue.get()
             if not instructions:
+                self.log_sink.flush()
                 sys.exit(1)
             try:
                 self.consume(instructions)
@@ -85,6 +85,8 @@ class Worker(Thread):
                 })
                 self.produce(instructions)
                 self.do_rollback(instructions)
+                self.log_sink.flush()
                 continue
 
             self.after_consume(instructions)
+            self.log_sink.flush()
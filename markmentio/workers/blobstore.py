@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import errno
+import shutil
+import hashlib
+import logging
+
+from threading import RLock
+from tempfile import NamedTemporaryFile
+from os.path import join, exists, dirname
+
+from markmentio import settings
+
+log = logging.getLogger('markmentio:workers')
+
+
+def git_blob_hasher(size):
+    """Returns a sha1 object that, once fed with `size` bytes of
+    contents, hashes to the git SHA of that blob."""
+    sha = hashlib.sha1()
+    sha.update(b"blob {0}\0".format(size))
+    return sha
+
+
+def git_blob_sha(data):
+    sha = git_blob_hasher(len(data))
+    sha.update(data)
+    return sha.hexdigest()
+
+
+class BlobStore(object):
+    """Content-addressed store of git blobs, keyed by their SHA.
+
+    It lives outside of the build directories so it survives across
+    builds and is shared by every repository. Blobs are materialized
+    into a checkout by hardlink, falling back to a copy when the
+    checkout is in another filesystem.
+
+    The modification time of each blob is bumped whenever it is used,
+    so that once the store grows past `max_size` the least recently
+    used blobs are evicted first.
+    """
+    def __init__(self, root, max_size):
+        self.root = root
+        self.max_size = max_size
+        self.lock = RLock()
+        # partial downloads, kept apart so they are never evicted
+        self.incoming = join(root, 'incoming')
+
+        if not exists(self.incoming):
+            os.makedirs(self.incoming)
+
+        self.size = sum(os.stat(path).st_size for path in self.iter_paths())
+
+    def path_for(self, sha):
+        return join(self.root, sha[:2], sha[2:])
+
+    def iter_paths(self):
+        for parent, directories, files in os.walk(self.root):
+            if parent == self.root and 'incoming' in directories:
+                directories.remove('incoming')
+
+            for name in files:
+                yield join(parent, name)
+
+    def has(self, sha):
+        return exists(self.path_for(sha))
+
+    def materialize(self, sha, destination):
+        """Places the blob at `destination`, returns False when the
+        blob is not in the store."""
+        source = self.path_for(sha)
+        try:
+            os.utime(source, None)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return False
+            raise
+
+        if exists(destination):
+            os.unlink(destination)
+
+        try:
+            try:
+                os.link(source, destination)
+            except OSError as e:
+                if e.errno == errno.ENOENT:
+                    raise
+                shutil.copyfile(source, destination)
+        except (OSError, IOError) as e:
+            if e.errno == errno.ENOENT and not exists(source):
+                # evicted since the utime above, it has to be fetched again
+                return False
+            raise
+
+        return True
+
+    def add(self, sha, data):
+        if git_blob_sha(data) != sha:
+            log.warning("Not storing blob %s because its contents don't match the SHA", sha)
+            return False
+
+        path = self.path_for(sha)
+        parent = dirname(path)
+        if not exists(parent):
+            os.makedirs(parent)
+
+        with NamedTemporaryFile(dir=self.incoming, delete=False) as f:
+            f.write(data)
+
+        os.rename(f.name, path)
+        self.grow(len(data))
+        return True
+
+    def add_file(self, sha, source):
+        """Moves an already downloaded and verified blob into the store."""
+        path = self.path_for(sha)
+        parent = dirname(path)
+        if not exists(parent):
+            os.makedirs(parent)
+
+        size = os.stat(source).st_size
+        shutil.move(source, path)
+        self.grow(size)
+
+    def grow(self, size):
+        with self.lock:
+            self.size += size
+            if self.size > self.max_size:
+                self.evict()
+
+    def evict(self):
+        """Removes the least recently used blobs until the store is back
+        under 90% of its maximum size."""
+        with self.lock:
+            entries = []
+            for path in self.iter_paths():
+                info = os.stat(path)
+                entries.append((info.st_mtime, info.st_size, path))
+
+            entries.sort()
+            self.size = sum(size for _, size, _ in entries)
+            target = self.max_size * 0.9
+
+            for mtime, size, path in entries:
+                if self.size <= target:
+                    break
+
+                try:
+                    os.unlink(path)
+                except OSError:
+                    continue
+
+                self.size -= size
+
+            log.info("Blob store evicted down to %d bytes", self.size)
+
+
+_store = None
+_store_lock = RLock()
+
+
+def get_blob_store():
+    """Returns the blob store shared by the whole process, or None when
+    it is disabled by an empty `BLOB_STORE_PATH`."""
+    global _store
+    if not settings.BLOB_STORE_PATH:
+        return None
+
+    with _store_lock:
+        if _store is None:
+            _store = BlobStore(settings.BLOB_STORE_PATH, settings.BLOB_STORE_MAX_SIZE)
+
+    return _store
@@ -3,26 +3,54 @@
 from __future__ import unicode_literals
 
 import os
+import re
 import sys
 import json
 import shutil
+import tarfile
+import yaml
 import subprocess
 import logging
 from urlparse import urlsplit
 
 from functools import partial
-from tempfile import TemporaryFile
-from os.path import dirname, abspath, join, expanduser, exists, relpath
+from threading import BoundedSemaphore, RLock
+from multiprocessing.pool import ThreadPool
+from tempfile import TemporaryFile, NamedTemporaryFile
+from os.path import (
+    dirname, abspath, join, expanduser, exists, relpath, normpath, isabs, basename, splitext, realpath,
+)
 
 from markmentio import settings
 from markmentio.workers.base import Worker
+from markmentio.workers.blobstore import get_blob_store, git_blob_hasher
+from markmentio.workers.workspaces import (
+    get_workspace_manager, locked, snapshot, disk_usage, WorkspaceQuotaExceeded,
+)
+from markmentio.workers.logsink import get_log_sink
 from markmentio.api import GithubEndpoint
-from redis import StrictRedis
+from markmentio.ratelimit import BUILD
+from markmentio.redispool import get_redis
 
 log = logging.getLogger('markmentio:workers')
 log.setLevel(logging.INFO)
 log.addHandler(logging.StreamHandler(sys.stdout))
 
+RAW_MEDIA_TYPE = 'application/vnd.github.v3.raw'
+SHA_PATTERN = re.compile(r'^[0-9a-f]{40}$')
+# the characters github allows in the name of an owner or a repository
+NAME_PATTERN = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+
+def validate_name(name):
+    """Returns the name of an owner or a repository as long as it is safe
+    to be used as a path component. Builds come from webhook payloads,
+    which anyone who knows a username can forge."""
+    if not NAME_PATTERN.match(name or '') or name in ('.', '..'):
+        raise ValueError("Invalid github name: {0!r}".format(name))
+
+    return name
+
 
 class LocalStem(object):
     # mode = "100644"
@@ -33,10 +61,11 @@ class LocalStem(object):
     # url = "https://api.github.com/.../git/blobs/9b21a51.."
     size = 0
 
-    def __init__(self, stem, api):
+    def __init__(self, stem, api, store=None, sink=None):
         self.__dict__.update(stem)
         self.api = api
-        self.redis = StrictRedis()
+        self.store = store
+        self.sink = sink or get_log_sink()
         self.is_tree = (self.type == 'tree')
         self.is_blob = (self.type == 'blob')
         self.children = []
@@ -54,11 +83,53 @@ class LocalStem(object):
 
         return reply, contents
 
+    def stream_blob(self, path, use_store=True):
+        """Downloads the raw contents of the blob straight into `path`
+        one chunk at a time, so memory stays flat regardless of the
+        size of the blob."""
+        store = use_store and self.store
+        response = self.api.stream(urlsplit(self.url).path, {'Accept': RAW_MEDIA_TYPE})
+        sha = git_blob_hasher(self.size)
+        root = store and store.incoming or dirname(path)
+
+        try:
+            f = NamedTemporaryFile(dir=root, delete=False)
+            try:
+                with f:
+                    for chunk in response.iter_content(settings.DOWNLOADER_CHUNK_SIZE):
+                        sha.update(chunk)
+                        f.write(chunk)
+            except Exception:
+                # the incoming directory is never evicted, a partial
+                # download left there would stay forever
+                os.unlink(f.name)
+                raise
+        finally:
+            response.close()
+
+        if sha.hexdigest() != self.sha:
+            # truncated or corrupted on the way
+            os.unlink(f.name)
+            raise IOError("{0} got SHA {1} but expected {2}".format(self.path, sha.hexdigest(), self.sha))
+
+        if store:
+            store.add_file(self.sha, f.name)
+            if store.materialize(self.sha, path):
+                return
+
+            # evicted as soon as it got in
+            return self.stream_blob(path, use_store=False)
+
+        shutil.move(f.name, path)
+
     def create_directory(self, path):
         if not exists(path):
             os.makedirs(path)
 
     def create_blob(self, path, data):
+        if self.store and self.store.add(self.sha, data) and self.store.materialize(self.sha, path):
+            return
+
         with open(path, 'wb') as f:
             f.write(data)
 
@@ -74,7 +145,7 @@ class LocalStem(object):
     def log(self, message, *args):
         msg = message % args
         log.info(message, *args)
-        self.redis.rpush("markmentio:logs", json.dumps({'message': msg}))
+        self.sink.push(msg)
 
     def persist(self, root):
         destination = join(root, self.path)
@@ -83,9 +154,17 @@ class LocalStem(object):
             #self.log("[LocalStem.persist] Ignoring existing %s %s", self.type.upper(), relpath(destination))
             return
 
+        if self.is_blob and self.store and self.store.materialize(self.sha, destination):
+            self.log("Reusing stored blob %s", destination)
+            return
+
+        if self.is_blob and settings.DOWNLOADER_STREAM_BLOBS:
+            self.log("Creating blob %s", destination)
+            return self.stream_blob(destination)
+
         meta, contents = self.fetch()
 
-        make_stem = partial(LocalStem, api=self.api)
+        make_stem = partial(LocalStem, api=self.api, store=self.store, sink=self.sink)
 
         if self.is_tree:
             self.log("Creating tree %s", destination)
@@ -100,69 +179,641 @@ class LocalStem(object):
             self.create_blob(destination, contents)
 
 
+class DownloadEngine(object):
+    """Persists blobs through a pool of threads shared by every build.
+
+    Each build gets its own cap of in-flight blobs so that a single
+    token cannot take over the whole pool (and its rate limit). The
+    first error raised by a blob stops scheduling the remaining ones
+    and is re-raised to the caller, just like the serial path does.
+    """
+    def __init__(self, pool_size):
+        self.pool_size = pool_size
+        self.pool = ThreadPool(pool_size)
+
+    def persist(self, pairs, concurrency=1):
+        if concurrency <= 1:
+            for stem, root in pairs:
+                stem.persist(root)
+            return
+
+        slots = BoundedSemaphore(min(concurrency, self.pool_size))
+        failures = []
+
+        def persist_one(stem, root):
+            try:
+                if not failures:
+                    stem.persist(root)
+            except Exception:
+                failures.append(sys.exc_info())
+            finally:
+                slots.release()
+
+        results = []
+        try:
+            for stem, root in pairs:
+                slots.acquire()
+                if failures:
+                    slots.release()
+                    break
+                results.append(self.pool.apply_async(persist_one, (stem, root)))
+        finally:
+            # even when listing the pairs blew up, nothing may still be
+            # writing into the destination once this returns
+            for result in results:
+                result.wait()
+
+        if failures:
+            exc_type, exc_value, exc_traceback = failures[0]
+            raise exc_type, exc_value, exc_traceback
+
+
+_engine = None
+_engine_lock = RLock()
+
+
+def get_download_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = DownloadEngine(settings.DOWNLOADER_POOL_SIZE)
+
+    return _engine
+
+
 class RepositoryFetcher(object):
-    def __init__(self, api, clone_path):
+    # bytes the checkout may take, enforced while it is written
+    quota = None
+
+    def __init__(self, api, clone_path, concurrency=1, engine=None, store=None, sparse=False, sink=None):
         self.api = api
         self.clone_path = clone_path
+        self.concurrency = concurrency
+        self.engine = engine or get_download_engine()
+        self.store = store
+        self.sparse = sparse
+        self.sink = sink or get_log_sink()
+        self.skipped_files = 0
+        self.skipped_bytes = 0
 
         self.owner = None
         self.repository = None
+        # the SHA of the commit that was actually fetched
+        self.commit = None
 
     @property
     def destination(self):
         return join(*filter(bool, [self.clone_path, self.owner, self.repository]))
 
-    def fetch(self, owner, repository, tree='HEAD'):
-        self.owner = owner
-        self.repository = repository
-        self.grab_tree(tree)
+    def fetch(self, owner, repository, tree='HEAD', recursive=True):
+        self.owner = validate_name(owner)
+        self.repository = validate_name(repository)
+        self.contained(self.destination)
+        self.grab_tree(self.pin(tree), recursive=recursive)
+
+    def pin(self, ref):
+        """Resolves `ref` to a commit upfront, so that the build records
+        the one it got even when the branch moves in the meantime, and
+        returns the SHA of its tree to be fetched."""
+        response = self.api.retrieve(self.api_path('repos', 'commits', ref), skip_cache=True)
+        reply = json.loads(response['response_data'])
+        self.commit = reply['sha']
+        return reply['commit']['tree']['sha']
+
+    def contained(self, path):
+        """Returns `path` once it is sure to resolve to somewhere under
+        the clone path, raises otherwise. Anything that gets deleted
+        goes through here first."""
+        root = realpath(self.clone_path)
+        if not realpath(path).startswith(root + os.sep):
+            raise ValueError("{0} is outside of {1}".format(path, root))
+
+        return path
+
+    def check_quota(self, size):
+        if self.quota is not None and size > self.quota:
+            raise WorkspaceQuotaExceeded("{0}/{1} takes over {2} bytes, its quota is {3}".format(
+                self.owner, self.repository, size, self.quota))
 
     def api_path(self, prefix, *path):
         return "/{0}".format(join(prefix, self.owner, self.repository, *path).lstrip(os.sep))
 
-    def grab_tree(self, tree):
+    def retrieve_tree(self, tree, recursive=False):
         path = self.api_path('repos', 'git', 'trees', tree)
+        if recursive:
+            path = '{0}?recursive=1'.format(path)
+
         response = self.api.retrieve(path, skip_cache=True)
 
         reply = json.loads(response['response_data'])
 
+        # names like HEAD or a branch are resolved by github, only a
+        # SHA can be checked against the reply
         sha = reply.get('sha', None)
-        if sha != tree:
+        if SHA_PATTERN.match(tree) and sha != tree:
             raise RuntimeError("reply got SHA {0} but expected {1}".format(sha, tree))
 
-        make_stem = partial(LocalStem, api=self.api)
+        return reply
+
+    def grab_tree(self, tree, recursive=True):
+        destination = self.destination
+
+        if not exists(destination):
+            os.makedirs(destination)
+
+        self.engine.persist(self.walk(tree, recursive), self.concurrency)
+
+    def walk(self, tree, recursive=True):
+        """Yields a `(blob, root)` pair for every blob in the given tree,
+        creating the directory layout along the way."""
+        if recursive:
+            reply = self.retrieve_tree(tree, recursive=True)
+            if not reply.get('truncated'):
+                listing = self.narrow(reply['tree'])
+                self.check_quota(sum(e.get('size', 0) for e in listing if e['type'] == 'blob'))
+                return self.walk_listing(listing)
+
+            log.warning("Tree listing of %s/%s was truncated, walking it one tree at a time",
+                        self.owner, self.repository)
+
+        reply = self.retrieve_tree(tree)
+        return self.walk_stems(map(self.make_stem, reply['tree']), self.destination)
+
+    def make_stem(self, stem):
+        return LocalStem(stem, api=self.api, store=self.store, sink=self.sink)
+
+    def narrow(self, listing):
+        """When fetching sparsely, keeps only what markment needs out of
+        a recursive listing: the markdown and assets under each
+        directory that has a `.markment.yml`, plus the whole theme
+        that it points to."""
+        if not self.sparse:
+            return listing
+
+        projects = []
+        themes = []
+        for entry in listing:
+            if entry['type'] != 'blob' or basename(entry['path']) != '.markment.yml':
+                continue
+
+            project = dirname(entry['path'])
+            projects.append(project)
+            theme = self.read_theme(entry)
+            if not theme or isabs(theme):
+                continue
+
+            theme = normpath(join(project, theme))
+            if theme != '..' and not theme.startswith('../'):
+                themes.append(theme)
+
+        if not projects:
+            log.warning("No .markment.yml found in %s/%s, fetching everything", self.owner, self.repository)
+            return listing
+
+        within = lambda path, root: not root or path.startswith(root + '/')
+        is_asset = lambda path: splitext(path)[1].lower() in settings.SPARSE_EXTENSIONS
+
+        kept = []
+        directories = set()
+        for entry in listing:
+            if entry['type'] != 'blob':
+                continue
+
+            path = entry['path']
+            if any(within(path, theme) for theme in themes) or \
+               (is_asset(path) and any(within(path, project) for project in projects)):
+                kept.append(entry)
+                parent = dirname(path)
+                while parent and parent not in directories:
+                    directories.add(parent)
+                    parent = dirname(parent)
+            else:
+                self.skipped_files += 1
+                self.skipped_bytes += entry.get('size', 0)
+
+        trees = [e for e in listing if e['type'] == 'tree' and e['path'] in directories]
+        log.info("Sparse fetch of %s/%s skips %d files (%d bytes)", self.owner, self.repository,
+                 self.skipped_files, self.skipped_bytes)
+        return trees + kept
+
+    def read_theme(self, entry):
+        meta, contents = self.make_stem(entry).fetch()
+        try:
+            config = yaml.safe_load(contents) or {}
+        except yaml.YAMLError:
+            log.exception("Failed to parse %s of %s/%s", entry['path'], self.owner, self.repository)
+            return None
+
+        return (config.get('project') or {}).get('theme')
+
+    def walk_listing(self, listing):
+        """Lays out a flat, recursive tree listing under the destination.
+
+        Every entry path is relative to the repository root, and
+        github lists parent trees before their children, so directories
+        can be created upfront without fetching the trees themselves.
+        """
+        destination = self.destination
+
+        stems = map(self.make_stem, listing)
+        for stem in stems:
+            if stem.is_tree:
+                stem.create_directory(join(destination, stem.path))
+
+        for stem in stems:
+            if stem.is_blob:
+                yield stem, destination
+
+    def walk_stems(self, stems, root, total=None):
+        # without a recursive listing the size is only known as it goes
+        total = total if total is not None else [0]
+        for stem in stems:
+            if stem.is_tree:
+                destination = join(root, stem.path)
+                meta, contents = stem.fetch()
+                stem.log("Creating tree %s", destination)
+                stem.create_directory(destination)
+                stem.children = map(self.make_stem, contents)
+
+                for pair in self.walk_stems(stem.children, destination, total):
+                    yield pair
+
+            elif stem.is_blob:
+                total[0] += stem.size
+                self.check_quota(total[0])
+                yield stem, root
+
+
+class IncrementalFetcher(RepositoryFetcher):
+    """Keeps one persistent checkout per repository and only fetches
+    the blobs that changed since the last successful sync.
+
+    The tree SHA of that sync is recorded in redis under
+    `markmentio:trees`, and the listing it came from is kept in a
+    manifest next to the checkout so the two trees can be diffed
+    locally. Whenever they don't agree, the checkout is fetched from
+    scratch.
+    """
+    def __init__(self, api, clone_path, concurrency=1, engine=None, store=None, sparse=False, sink=None,
+                 redis=None):
+        super(IncrementalFetcher, self).__init__(api, clone_path, concurrency, engine, store, sparse, sink)
+        self.redis = redis or get_redis()
+        self.tree_sha = None
+
+    @property
+    def full_name(self):
+        return "{0}/{1}".format(self.owner, self.repository)
+
+    @property
+    def manifest_path(self):
+        return "{0}.tree.json".format(self.contained(self.destination))
+
+    def load_manifest(self):
+        recorded_sha = self.redis.hget("markmentio:trees", self.full_name)
+        if not recorded_sha or not exists(self.manifest_path) or not exists(self.destination):
+            return None
+
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+
+        if manifest['sha'] != recorded_sha:
+            return None
+
+        return manifest
+
+    def save_manifest(self, sha, listing):
+        entries = dict([(entry['path'], [entry['type'], entry['sha']]) for entry in listing])
+        with open(self.manifest_path, 'w') as f:
+            json.dump({'sha': sha, 'entries': entries}, f)
+
+        self.redis.hset("markmentio:trees", self.full_name, sha)
+        self.tree_sha = sha
+
+    def forget(self):
+        self.redis.hdel("markmentio:trees", self.full_name)
+        if exists(self.manifest_path):
+            os.unlink(self.manifest_path)
+
+    def grab_tree(self, tree, recursive=True):
+        self.contained(self.destination)
+        previous = self.load_manifest()
+        # until this sync is done the checkout matches no tree at all
+        self.forget()
+
+        reply = self.retrieve_tree(tree, recursive=True)
+        if reply.get('truncated'):
+            log.warning("Tree listing of %s was truncated, fetching it from scratch", self.full_name)
+            shutil.rmtree(self.destination, True)
+            return super(IncrementalFetcher, self).grab_tree(tree, recursive=False)
+
+        listing = self.narrow(reply['tree'])
+        # the whole checkout counts, not only what changed
+        self.check_quota(sum(e.get('size', 0) for e in listing if e['type'] == 'blob'))
+        if previous is None:
+            shutil.rmtree(self.destination, True)
+            os.makedirs(self.destination)
+            pairs = self.walk_listing(listing)
+        else:
+            pairs = self.walk_changes(previous['entries'], listing)
+
+        self.engine.persist(pairs, self.concurrency)
+        self.save_manifest(reply['sha'], listing)
+
+    def walk_changes(self, previous, listing):
         destination = self.destination
+        current = dict([(entry['path'], [entry['type'], entry['sha']]) for entry in listing])
+
+        # deepest paths first, so files go away before their trees
+        for path in sorted(previous, reverse=True):
+            kind, sha = previous[path]
+            if current.get(path, [None])[0] == kind:
+                continue
+
+            self.remove_path(join(destination, path))
+
+        changes = []
+        for entry in listing:
+            kind, sha = previous.get(entry['path'], [None, None])
+            if entry['type'] == 'tree' or sha != entry['sha']:
+                if entry['type'] == 'blob':
+                    self.remove_path(join(destination, entry['path']))
+                changes.append(entry)
+
+        log.info("Syncing %d changed entries of %s", len(changes), self.full_name)
+        return self.walk_listing(changes)
+
+    def remove_path(self, path):
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, True)
+        elif os.path.lexists(path):
+            os.unlink(path)
+
+
+class ArchiveFetcher(RepositoryFetcher):
+    """Downloads the whole repository as a single tarball, extracting
+    it into the destination while it streams in."""
+
+    def pin(self, ref):
+        # tarballs are addressed by commit, not by tree
+        super(ArchiveFetcher, self).pin(ref)
+        return self.commit
+
+    def archive_path(self, tree):
+        if tree == 'HEAD':
+            return self.api_path('repos', 'tarball')
+
+        return self.api_path('repos', 'tarball', tree)
+
+    def grab_tree(self, tree, recursive=True):
+        destination = self.contained(self.destination)
+        shutil.rmtree(destination, True)
+        os.makedirs(destination)
+
+        response = self.api.stream(self.archive_path(tree))
+        try:
+            self.extract(response.raw, destination)
+        finally:
+            response.close()
+
+    def extract(self, fileobj, destination):
+        archive = tarfile.open(fileobj=fileobj, mode='r|*')
+        total_files = total_bytes = 0
+
+        for member in archive:
+            # github wraps everything in a "<owner>-<repository>-<sha>/" directory
+            parts = member.name.split('/', 1)
+            if len(parts) < 2 or not parts[1].strip('/'):
+                continue
+
+            name = normpath(parts[1])
+            if isabs(name) or name == '..' or name.startswith('../'):
+                log.warning("Skipping archive member outside of the repository: %s", member.name)
+                continue
+
+            if not (member.isfile() or member.isdir()):
+                continue
+
+            self.check_quota(total_bytes + member.size)
+            member.name = name
+            archive.extract(member, destination)
+            if member.isfile():
+                total_files += 1
+                total_bytes += member.size
+
+        archive.close()
+        log.info("Extracted %d files (%d bytes) of %s/%s", total_files, total_bytes,
+                 self.owner, self.repository)
+
+
+class GitFetcher(RepositoryFetcher):
+    """Keeps a bare mirror of each repository on the worker host and
+    checks builds out of it, so that git's delta transfer only brings
+    in the objects that the mirror is missing.
+
+    Every fetch is shallow and lands in `refs/markmentio/head`, the
+    checkout then goes straight into the destination through an index
+    file of its own, leaving the mirror untouched.
+    """
+    ref = 'HEAD'
+
+    def pin(self, ref):
+        # resolved against the mirror once it is fetched
+        return ref
+
+    @property
+    def mirror_path(self):
+        return join(settings.GIT_MIRROR_ROOT, self.owner, "{0}.git".format(self.repository))
+
+    @property
+    def remote_url(self):
+        return settings.GIT_REMOTE_URL.format(owner=self.owner, repository=self.repository)
+
+    def git(self, *args, **kw):
+        command = [settings.GIT_BIN_PATH, '--git-dir', self.mirror_path] + list(args)
+        log.info("Running %s", " ".join(command))
+        return subprocess.check_output(command, stderr=subprocess.STDOUT, **kw)
+
+    def resolve(self, commit):
+        try:
+            return self.git('rev-parse', '--verify', '--quiet', '{0}^{{commit}}'.format(commit)).strip()
+        except subprocess.CalledProcessError:
+            return None
+
+    def grab_tree(self, tree, recursive=True):
+        # it comes from the webhook payload and ends up in git's command line
+        if tree != 'HEAD' and not SHA_PATTERN.match(tree):
+            raise ValueError("Refusing to fetch {0!r}, it is not a commit SHA".format(tree))
 
+        destination = self.destination
         if not exists(destination):
             os.makedirs(destination)
-        for stem in map(make_stem, reply['tree']):
-            stem.persist(destination)
+
+        with locked(self.mirror_path):
+            if not exists(self.mirror_path):
+                os.makedirs(self.mirror_path)
+                self.git('init', '--bare', '--quiet')
+
+            self.git('fetch', '--quiet', '--depth', str(settings.GIT_FETCH_DEPTH), '--',
+                     self.remote_url, '+{0}:refs/markmentio/head'.format(self.ref))
+
+            commit = self.resolve('refs/markmentio/head')
+            if tree != 'HEAD':
+                commit = self.resolve(tree) or self.fetch_commit(tree)
+
+            self.check_mirror_quota()
+            self.check_quota(self.tree_size(commit))
+            self.checkout(commit, destination)
+            self.commit = commit
+
+    def check_mirror_quota(self):
+        """The mirror is shared by every build of the repository, when it
+        grows over the quota it is dropped and fetched again next time."""
+        try:
+            self.check_quota(disk_usage(self.mirror_path))
+        except WorkspaceQuotaExceeded:
+            shutil.rmtree(self.mirror_path, True)
+            raise
+
+    def tree_size(self, commit):
+        total = 0
+        for line in self.git('ls-tree', '-r', '-l', commit).splitlines():
+            size = line.split('\t', 1)[0].split()[-1]
+            if size.isdigit():
+                total += int(size)
+
+        return total
+
+    def fetch_commit(self, commit):
+        """Fetches a commit that is not within GIT_FETCH_DEPTH of the
+        head anymore, building some other commit instead would publish
+        the wrong documentation under its SHA."""
+        try:
+            self.git('fetch', '--quiet', '--depth', str(settings.GIT_FETCH_DEPTH), '--',
+                     self.remote_url, commit)
+        except subprocess.CalledProcessError as e:
+            log.warning("Failed to fetch %s from %s: %s", commit, self.remote_url, e.output)
+
+        resolved = self.resolve(commit)
+        if not resolved:
+            raise RuntimeError("{0}/{1} has no commit {2}".format(self.owner, self.repository, commit))
+
+        return resolved
+
+    def checkout(self, commit, destination):
+        index_path = "{0}.index".format(destination)
+        env = dict(os.environ, GIT_INDEX_FILE=index_path)
+        try:
+            self.git('read-tree', commit, env=env)
+            self.git('--work-tree', destination, 'checkout-index', '--all', '--force', env=env)
+        finally:
+            if exists(index_path):
+                os.unlink(index_path)
+
+        log.info("Checked %s/%s out at %s", self.owner, self.repository, commit)
 
 
 class GithubDownloader(Worker):
+    def choose_strategy(self, api, instructions, owner_name, repository_name):
+        """Returns either "api", "archive" or "git". The "auto" strategy lists
+        the tree once and picks the archive for repositories with too
+        many files to be fetched one blob at a time, unless there is a
+        previous sync to be updated incrementally or only the files
+        markment needs are to be fetched."""
+        strategy = instructions.get('fetch_strategy', settings.DOWNLOADER_STRATEGY)
+        if strategy != 'auto':
+            return strategy
+
+        full_name = "{0}/{1}".format(owner_name, repository_name)
+        incremental = instructions.get('incremental', settings.DOWNLOADER_INCREMENTAL)
+        if incremental and get_redis().hexists("markmentio:trees", full_name):
+            return 'api'
+
+        fetcher = RepositoryFetcher(api, None)
+        fetcher.owner = owner_name
+        fetcher.repository = repository_name
+        try:
+            reply = fetcher.retrieve_tree('HEAD', recursive=True)
+        except Exception:
+            log.exception("Failed to list the tree of %s, falling back to the api", full_name)
+            return 'api'
+
+        if reply.get('truncated'):
+            # too big to be listed at once, so it could not be narrowed anyway
+            return 'archive'
+
+        # only the api strategy can leave files out
+        if instructions.get('sparse', settings.DOWNLOADER_SPARSE):
+            return 'api'
+
+        total_blobs = len([e for e in reply['tree'] if e['type'] == 'blob'])
+        if total_blobs >= settings.DOWNLOADER_ARCHIVE_MIN_FILES:
+            return 'archive'
+
+        return 'api'
+
     def consume(self, instructions):
         repository = instructions['repository']
         token = instructions['token']
-        repository_name = repository['name']
+        # both end up in the paths of the workspace and of the sync root
+        repository_name = validate_name(repository['name'])
         owner = repository['owner']
-        owner_name = owner['name']
-
-        clone_path = instructions['clone_path']
-        destination_path = join(clone_path, owner_name, repository_name)
+        owner_name = validate_name(owner['name'])
 
-        api = GithubEndpoint(token)
+        api = GithubEndpoint(token, priority=BUILD)
 
-        self.log("Getting ready to clone %s/%s", owner_name, repository_name)
-        if exists(clone_path):
-            shutil.rmtree(clone_path, True)
-
-        os.makedirs(clone_path)
+        full_name = "{0}/{1}".format(owner_name, repository_name)
+        workspaces = get_workspace_manager()
+        clone_path = instructions.get('workspace') or workspaces.allocate(full_name)
+        # so that the workspace is released even when this step blows up
+        instructions['workspace'] = clone_path
+        destination_path = join(clone_path, owner_name, repository_name)
 
         success = True
+        fetcher = None
         try:
-            fetcher = RepositoryFetcher(api, clone_path)
-            fetcher.fetch(owner_name, repository_name)
-            self.log("Done fetching %s/%s", owner_name, repository_name)
+            strategy = self.choose_strategy(api, instructions, owner_name, repository_name)
+            incremental = strategy == 'api' and instructions.get('incremental', settings.DOWNLOADER_INCREMENTAL)
+            self.log("Getting ready to clone %s using the %s strategy", full_name, strategy)
+
+            concurrency = min(instructions.get('concurrency', settings.DOWNLOADER_BUILD_CONCURRENCY),
+                              settings.DOWNLOADER_BUILD_CONCURRENCY)
+            if strategy == 'archive':
+                Fetcher = ArchiveFetcher
+            elif strategy == 'git':
+                Fetcher = GitFetcher
+            elif incremental:
+                Fetcher = IncrementalFetcher
+            else:
+                Fetcher = RepositoryFetcher
+
+            sparse = instructions.get('sparse', settings.DOWNLOADER_SPARSE)
+            if sparse and strategy != 'api':
+                self.log("The %s strategy fetches all of %s, sparse fetching is off", strategy, full_name)
+                sparse = False
+
+            recursive = instructions.get('recursive_tree', settings.DOWNLOADER_RECURSIVE_TREE)
+            if incremental:
+                # the persistent checkout is shared by every build of
+                # this repository, each build gets its own snapshot
+                fetcher = Fetcher(api, settings.SYNC_ROOT, concurrency,
+                                  store=get_blob_store(), sparse=sparse, sink=self.log_sink)
+                fetcher.quota = workspaces.quota
+                with locked(join(settings.SYNC_ROOT, owner_name, repository_name)):
+                    fetcher.fetch(owner_name, repository_name, recursive=recursive)
+                    snapshot(fetcher.destination, destination_path)
+            elif strategy == 'git':
+                fetcher = Fetcher(api, clone_path, sink=self.log_sink)
+                fetcher.quota = workspaces.quota
+                fetcher.ref = instructions.get('ref', 'HEAD')
+                fetcher.fetch(owner_name, repository_name, tree=instructions.get('after', 'HEAD'))
+            else:
+                fetcher = Fetcher(api, clone_path, concurrency,
+                                  store=get_blob_store(), sparse=sparse, sink=self.log_sink)
+                fetcher.quota = workspaces.quota
+                fetcher.fetch(owner_name, repository_name, recursive=recursive)
+
+            workspaces.check_quota(clone_path)
+            self.log("Done fetching %s", full_name)
         except Exception as e:
             success = False
             import traceback
@@ -171,9 +822,16 @@ class GithubDownloader(Worker):
         payload = {
             'success': success,
             'clone_path': clone_path,
+            'workspace': clone_path,
             'destination_path': destination_path,
             'repository': repository,
+            'commit': fetcher and fetcher.commit,
             'token': token
         }
+        if fetcher and fetcher.sparse:
+            payload['sparse'] = {
+                'skipped_files': fetcher.skipped_files,
+                'skipped_bytes': fetcher.skipped_bytes,
+            }
 
         self.produce(payload)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+import json
+import atexit
+import logging
+
+from threading import RLock, Thread
+
+from markmentio import settings
+from markmentio.redispool import get_redis
+
+log = logging.getLogger('markmentio:workers')
+
+
+class LogSink(object):
+    """Buffers build log messages and pushes them to redis in batches.
+
+    The buffer is flushed through a single pipeline whenever it holds
+    `max_size` messages or its oldest message is `max_delay` seconds
+    old, and one last time when the process exits.
+    """
+    def __init__(self, redis=None, key="markmentio:logs", max_size=None, max_delay=None):
+        self.redis = redis or get_redis()
+        self.key = key
+        self.max_size = max_size or settings.LOG_SINK_MAX_SIZE
+        self.max_delay = max_delay or settings.LOG_SINK_MAX_DELAY
+        self.lock = RLock()
+        # held while a batch is on its way, so batches never overtake
+        # each other between the timer and a full buffer
+        self.flush_lock = RLock()
+        self.buffer = []
+        self.oldest = None
+
+        flusher = Thread(target=self.keep_flushing)
+        flusher.daemon = True
+        flusher.start()
+        atexit.register(self.flush)
+
+    def push(self, message):
+        with self.lock:
+            if not self.buffer:
+                self.oldest = time.time()
+
+            self.buffer.append(json.dumps({'message': message}))
+            full = len(self.buffer) >= self.max_size
+
+        if full:
+            self.flush()
+
+    def is_stale(self):
+        return self.buffer and time.time() - self.oldest >= self.max_delay
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                messages, self.buffer = self.buffer, []
+
+            if not messages:
+                return
+
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for start in range(0, len(messages), self.max_size):
+                    pipe.rpush(self.key, *messages[start:start + self.max_size])
+                pipe.execute()
+            except Exception:
+                log.exception("Failed to flush %d log messages to %s", len(messages), self.key)
+
+    def keep_flushing(self):
+        while True:
+            time.sleep(self.max_delay)
+            if self.is_stale():
+                self.flush()
+
+
+_sink = None
+_sink_lock = RLock()
+
+
+def get_log_sink():
+    """Returns a sink shared by everything in the process that logs to
+    redis without a sink of its own."""
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            _sink = LogSink()
+
+    return _sink
@@ -6,10 +6,12 @@ from Queue import Queue
 
 
 class Pipeline(object):
-    def __init__(self):
+    def __init__(self, concurrency=1):
         self.running = False
         self.queues = [Queue() for _ in self.steps] + [Queue()]
-        self.workers = [self.make_worker(Worker, index) for index, Worker in enumerate(self.steps)]
+        self.workers = [self.make_worker(Worker, index)
+                        for index, Worker in enumerate(self.steps)
+                        for _ in range(concurrency)]
 
     def make_worker(self, Worker, index):
         return Worker(self.queues[index], self.queues[index + 1])
@@ -10,6 +10,7 @@ import subprocess
 import markment.plugins.autoindex
 
 from tempfile import TemporaryFile
+from datetime import datetime
 
 from os.path import dirname, abspath, join, expanduser, exists
 from markment.core import Project
@@ -36,7 +37,9 @@ class StaticGenerator(Worker):
             msg = 'No .markment.yml found in the project {repository[name]}'.format(**instructions)
             payload = {
                 'success': False,
-                'error': msg
+                'error': msg,
+                'repository': instructions['repository'],
+                'workspace': instructions.get('workspace'),
             }
             self.log("Error generating docs: %s", msg)
             return self.produce(payload)
@@ -60,13 +63,19 @@ class StaticGenerator(Worker):
         repository = instructions['repository']
         owner = repository['owner']['name']
         name = repository['name']
-        static_destination = join(settings.DOCUMENTATION_ROOT, owner, name).format(project.name)
+        # generated inside the build's own workspace, so that builds
+        # running at the same time never share a directory
+        documentation_root = settings.DOCUMENTATION_ROOT
+        if instructions.get('workspace'):
+            documentation_root = join(instructions['workspace'], 'documentation')
+
+        static_destination = join(documentation_root, owner, name).format(project.name)
         self.log("Running markment")
 
         generated = destination.persist(static_destination, gently=True)
         self.log("Markment is done")
 
-        documentation_root_node = Node(settings.DOCUMENTATION_ROOT)
+        documentation_root_node = Node(documentation_root)
         index = []
 
         self.log("Preparing markment-io S3 bucket")
@@ -98,8 +107,13 @@ class StaticGenerator(Worker):
             'documentation_path': static_destination,
             'repository': repository,
             'index': index,
-            'bucket': bucket_info
+            'bucket': bucket_info,
+            'commit': instructions.get('commit'),
+            'built_at': datetime.utcnow().isoformat(),
+            'workspace': instructions.get('workspace'),
         }
+        if 'sparse' in instructions:
+            payload['sparse'] = instructions['sparse']
 
         self.log("Done generating %s", json.dumps(payload, indent=2))
         self.produce(payload)
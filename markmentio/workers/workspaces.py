@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import re
+import fcntl
+import shutil
+import logging
+
+from threading import RLock
+from tempfile import mkdtemp
+from contextlib import contextmanager
+from os.path import join, exists, abspath, dirname
+
+from markmentio import settings
+
+log = logging.getLogger('markmentio:workers')
+
+
+class WorkspaceQuotaExceeded(Exception):
+    pass
+
+
+def disk_usage(path):
+    """Returns the apparent size of every file under `path`, in bytes"""
+    total = 0
+    for parent, directories, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(join(parent, name)).st_size
+            except OSError:
+                continue
+
+    return total
+
+
+def snapshot(source, destination):
+    """Mirrors the `source` directory into `destination` by hardlinking
+    every file, falling back to copies across filesystems."""
+    for parent, directories, files in os.walk(source):
+        target = join(destination, os.path.relpath(parent, source))
+        if not exists(target):
+            os.makedirs(target)
+
+        for name in files:
+            try:
+                os.link(join(parent, name), join(target, name))
+            except OSError:
+                shutil.copy2(join(parent, name), join(target, name))
+
+
+@contextmanager
+def locked(path):
+    """Holds an exclusive lock on `path` for as long as the context
+    lasts, between threads and processes alike."""
+    parent = dirname(path)
+    if not exists(parent):
+        os.makedirs(parent)
+
+    with open("{0}.lock".format(path), 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class WorkspaceManager(object):
+    """Hands out one scratch directory per build under `root`, so that
+    builds running at the same time never step on each other.
+
+    Each workspace is allowed up to `quota` bytes, and is removed
+    entirely once the build is done with it.
+    """
+    def __init__(self, root, quota):
+        self.root = abspath(root)
+        self.quota = quota
+
+        if not exists(self.root):
+            os.makedirs(self.root)
+
+    def allocate(self, name):
+        prefix = "{0}-".format(re.sub(r'\W+', '-', name).strip('-'))
+        path = mkdtemp(prefix=prefix, dir=self.root)
+        log.info("Allocated workspace %s", path)
+        return path
+
+    def check_quota(self, path):
+        usage = disk_usage(path)
+        if usage > self.quota:
+            raise WorkspaceQuotaExceeded(
+                "workspace {0} uses {1} bytes, over its quota of {2}".format(path, usage, self.quota))
+
+        return usage
+
+    def release(self, path):
+        path = abspath(path)
+        if dirname(path) != self.root:
+            log.warning("Refusing to release %s, it is not a workspace under %s", path, self.root)
+            return
+
+        shutil.rmtree(path, True)
+        log.info("Released workspace %s", path)
+
+
+_manager = None
+_manager_lock = RLock()
+
+
+def get_workspace_manager():
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = WorkspaceManager(settings.WORKSPACE_ROOT, settings.WORKSPACE_QUOTA)
+
+    return _manager
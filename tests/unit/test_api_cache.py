@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+from mock import patch, Mock
+from sure import expect
+
+from markmentio import settings
+from markmentio.api import GithubEndpoint
+
+
+class CacheRedis(object):
+    """Just the strings and sets the api cache is kept in"""
+    def __init__(self):
+        self.strings = {}
+        self.sets = {}
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def get(self, key):
+        return self.strings.get(key)
+
+    def setex(self, key, lifetime, value):
+        self.strings[key] = value
+
+    def sadd(self, key, value):
+        self.sets.setdefault(key, set()).add(value)
+
+    def expire(self, key, lifetime):
+        pass
+
+    def execute(self):
+        pass
+
+
+def make_endpoint():
+    redis = CacheRedis()
+    with patch('markmentio.api.get_cache_redis', return_value=redis), \
+            patch('markmentio.api.get_http_session'):
+        endpoint = GithubEndpoint('token')
+
+    endpoint.get_from_web = Mock()
+    return endpoint, redis
+
+
+def primitive(body, status_code=200, headers=None):
+    return {
+        'url': 'https://api.github.com/repos/owner/repo',
+        'request_headers': {},
+        'request_data': {},
+        'response_headers': headers or {},
+        'error': None,
+        'response_data': body,
+        'cached': False,
+        'status_code': status_code,
+    }
+
+
+def test_cache_object_round_trip():
+    ("GithubEndpoint packs only the headers and the body that callers of "
+     "retrieve need, and unpacks them back")
+    endpoint, redis = make_endpoint()
+    response = primitive(b'{"name": "repo"}', headers={
+        'ETag': '"abc"',
+        'Link': '<https://api.github.com/x?page=2>; rel="next"',
+        'X-RateLimit-Remaining': '10',
+    })
+    response['expires_at'] = 1234.5
+
+    decoded = endpoint.decode_cache_object(endpoint.encode_cache_object(response))
+
+    expect(decoded['response_data']).to.equal(b'{"name": "repo"}')
+    expect(decoded['status_code']).to.equal(200)
+    expect(decoded['expires_at']).to.equal(1234.5)
+    expect(decoded['cached']).to.be.true
+    expect(decoded['response_headers']).to.equal({
+        'etag': '"abc"',
+        'link': '<https://api.github.com/x?page=2>; rel="next"',
+    })
+
+
+@patch.object(settings, 'API_LOCAL_CACHE_SIZE', 0)
+def test_skip_cache_is_not_cached():
+    "GithubEndpoint.retrieve does not cache what it fetches with skip_cache"
+    endpoint, redis = make_endpoint()
+    endpoint.get_from_web.return_value = primitive(b'{"tree": []}')
+
+    expect(endpoint.retrieve('/repos/owner/repo', skip_cache=True)['response_data']).to.equal(b'{"tree": []}')
+    expect(redis.strings).to.be.empty
+
+
+@patch.object(settings, 'API_LOCAL_CACHE_SIZE', 0)
+def test_not_modified_revalidates_the_cached_copy():
+    ("GithubEndpoint.refresh sends the validators of an expired copy and "
+     "keeps serving it for another TIMEOUT when github replies 304")
+    endpoint, redis = make_endpoint()
+    cached = primitive(b'{"name": "repo"}', headers={'etag': '"abc"'})
+    cached['expires_at'] = time.time() - 1
+    endpoint.get_from_web.return_value = primitive(b'', status_code=304)
+
+    response = endpoint.refresh('/repos/owner/repo', cached)
+
+    headers = endpoint.get_from_web.call_args[0][1]
+    expect(headers['If-None-Match']).to.equal('"abc"')
+    expect(response['response_data']).to.equal(b'{"name": "repo"}')
+    expect(response['expires_at']).to.be.greater_than(time.time() + endpoint.TIMEOUT - 5)
+
+    stored = endpoint.find_cache_object(cached['url'])
+    expect(stored['response_data']).to.equal(b'{"name": "repo"}')
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import io
+import os
+import json
+import shutil
+import tarfile
+import tempfile
+import requests
+
+from threading import Thread
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from mock import patch
+from sure import expect
+from os.path import join, exists, dirname
+
+from markmentio import settings
+from markmentio.workers.downloader import ArchiveFetcher, GithubDownloader, validate_name
+from markmentio.workers.workspaces import WorkspaceQuotaExceeded
+
+PREFIX = 'owner-repo-0123abc/'
+
+
+def make_tarball(members):
+    buf = io.BytesIO()
+    archive = tarfile.open(fileobj=buf, mode='w:gz')
+    for name, contents in members:
+        info = tarfile.TarInfo(name)
+        if contents is None:
+            info.type = tarfile.SYMTYPE
+            info.linkname = '/etc/passwd'
+            archive.addfile(info)
+        else:
+            info.size = len(contents)
+            archive.addfile(info, io.BytesIO(contents))
+    archive.close()
+    return buf.getvalue()
+
+
+TARBALL = make_tarball([
+    (PREFIX + 'README.md', b'# Readme\n'),
+    (PREFIX + 'docs/index.md', b'# Docs\n'),
+    (PREFIX + '../escape.txt', b'outside\n'),
+    (PREFIX + 'docs/../../escape2.txt', b'outside\n'),
+    (PREFIX + 'link', None),
+])
+
+
+def listing(total_blobs, truncated=False):
+    return json.dumps({
+        'sha': 'f' * 40,
+        'truncated': truncated,
+        'tree': [{'path': 'file{0}.md'.format(i), 'type': 'blob', 'sha': '{0:040x}'.format(i)}
+                 for i in range(total_blobs)],
+    })
+
+
+class LocalGithub(object):
+    """Serves canned replies to the paths of the github api"""
+    def __init__(self, replies):
+        replies = dict(replies)
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = replies.get(self.path)
+                self.send_response(body is None and 404 or 200)
+                self.send_header('Content-Length', str(len(body or b'')))
+                self.end_headers()
+                self.wfile.write(body or b'')
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = 'http://127.0.0.1:{0}'.format(self.server.server_port)
+        thread = Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def retrieve(self, path, skip_cache=False):
+        response = requests.get(self.base_url + path)
+        return {'response_data': response.content, 'status_code': response.status_code}
+
+    def stream(self, path, headers=None):
+        response = requests.get(self.base_url + path, stream=True)
+        response.raise_for_status()
+        return response
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def test_extract_strips_the_top_directory_and_skips_unsafe_members():
+    ("ArchiveFetcher.extract strips github's top level directory and skips "
+     "members outside of the repository or that are not regular files")
+    root = tempfile.mkdtemp()
+    try:
+        destination = join(root, 'owner', 'repo')
+        fetcher = ArchiveFetcher(None, root, sink=object())
+        fetcher.extract(io.BytesIO(TARBALL), destination)
+
+        expect(open(join(destination, 'README.md')).read()).to.equal('# Readme\n')
+        expect(open(join(destination, 'docs', 'index.md')).read()).to.equal('# Docs\n')
+        expect(exists(join(root, 'owner', 'escape.txt'))).to.be.false
+        expect(exists(join(root, 'owner', 'escape2.txt'))).to.be.false
+        expect(exists(join(destination, 'link'))).to.be.false
+    finally:
+        shutil.rmtree(root, True)
+
+
+def test_extract_enforces_the_quota():
+    ("ArchiveFetcher.extract stops as soon as the checkout would go over "
+     "its quota, before writing the member that crosses it")
+    root = tempfile.mkdtemp()
+    try:
+        destination = join(root, 'owner', 'repo')
+        fetcher = ArchiveFetcher(None, root, sink=object())
+        fetcher.quota = len('# Readme\n')
+
+        fetcher.extract.when.called_with(io.BytesIO(TARBALL), destination).should.throw(
+            WorkspaceQuotaExceeded)
+
+        expect(exists(join(destination, 'README.md'))).to.be.true
+        expect(exists(join(destination, 'docs', 'index.md'))).to.be.false
+    finally:
+        shutil.rmtree(root, True)
+
+
+def test_validate_name():
+    ("validate_name accepts github names and rejects anything that would "
+     "move out of the directory it is joined to")
+    expect(validate_name('markment-io')).to.equal('markment-io')
+    expect(validate_name('some_repo.js')).to.equal('some_repo.js')
+
+    for name in ['', None, '.', '..', '/home', 'a/b', '../etc', 'a b']:
+        validate_name.when.called_with(name).should.throw(ValueError)
+
+
+def test_fetch_refuses_to_leave_the_clone_path():
+    ("ArchiveFetcher.fetch never deletes anything outside of its clone "
+     "path, whatever the names it is given")
+    root = tempfile.mkdtemp()
+    try:
+        clone_path = join(root, 'workspace')
+        victim = join(root, 'victim')
+        os.makedirs(clone_path)
+        os.makedirs(victim)
+        os.symlink(root, join(clone_path, 'owner'))
+
+        fetcher = ArchiveFetcher(None, clone_path, sink=object())
+        fetcher.fetch.when.called_with('..', 'victim').should.throw(ValueError)
+        fetcher.fetch.when.called_with('owner', 'victim').should.throw(ValueError)
+
+        expect(exists(victim)).to.be.true
+    finally:
+        shutil.rmtree(root, True)
+
+
+def test_fetch_streams_the_tarball():
+    ("ArchiveFetcher.fetch resolves HEAD to a commit, then downloads and "
+     "extracts the tarball of that very commit")
+    commit = '0123abc' + '0' * 33
+    github = LocalGithub([
+        ('/repos/owner/repo/commits/HEAD', json.dumps({'sha': commit, 'commit': {'tree': {'sha': 'f' * 40}}})),
+        ('/repos/owner/repo/tarball/' + commit, TARBALL),
+    ])
+    root = tempfile.mkdtemp()
+    try:
+        fetcher = ArchiveFetcher(github, root, sink=object())
+        fetcher.fetch('owner', 'repo')
+
+        expect(fetcher.commit).to.equal(commit)
+        expect(open(join(root, 'owner', 'repo', 'docs', 'index.md')).read()).to.equal('# Docs\n')
+        expect(exists(join(dirname(fetcher.destination), 'escape.txt'))).to.be.false
+    finally:
+        shutil.rmtree(root, True)
+        github.close()
+
+
+def choose(total_blobs, truncated=False, sparse=False):
+    github = LocalGithub([
+        ('/repos/owner/repo/git/trees/HEAD?recursive=1', listing(total_blobs, truncated)),
+    ])
+    try:
+        downloader = GithubDownloader(None, None)
+        instructions = {'fetch_strategy': 'auto', 'incremental': False, 'sparse': sparse}
+        return downloader.choose_strategy(github, instructions, 'owner', 'repo')
+    finally:
+        github.close()
+
+
+@patch.object(settings, 'DOWNLOADER_ARCHIVE_MIN_FILES', 3)
+def test_auto_strategy():
+    "The auto strategy picks the archive for repositories with many files"
+    expect(choose(5)).to.equal('archive')
+    expect(choose(3)).to.equal('archive')
+    expect(choose(2)).to.equal('api')
+    expect(choose(2, truncated=True)).to.equal('archive')
+
+
+@patch.object(settings, 'DOWNLOADER_ARCHIVE_MIN_FILES', 3)
+def test_auto_strategy_when_sparse():
+    ("The auto strategy sticks to the api when fetching sparsely, since "
+     "the archive cannot leave files out, unless the listing is truncated")
+    expect(choose(5, sparse=True)).to.equal('api')
+    expect(choose(5, truncated=True, sparse=True)).to.equal('archive')
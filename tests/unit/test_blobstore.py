@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import time
+import shutil
+import tempfile
+
+from mock import patch
+from sure import expect
+from os.path import join, exists
+
+from markmentio.workers.blobstore import BlobStore, git_blob_sha
+
+
+def with_store(max_size=1024 * 1024):
+    def decorator(test):
+        def wrapper():
+            root = tempfile.mkdtemp()
+            try:
+                test(BlobStore(join(root, 'blobs'), max_size), root)
+            finally:
+                shutil.rmtree(root, True)
+
+        wrapper.__name__ = test.__name__
+        wrapper.__doc__ = test.__doc__
+        return wrapper
+    return decorator
+
+
+def test_git_blob_sha():
+    "git_blob_sha hashes contents the way git hashes blobs"
+    # echo 'hello world' | git hash-object --stdin
+    expect(git_blob_sha(b"hello world\n")).to.equal('3b18e512dba79e4c8300dd08aeb37f8e728b8dad')
+
+
+@with_store()
+def test_add_and_materialize(store, root):
+    "BlobStore.add keeps a verified blob that materialize hardlinks into a checkout"
+    data = b"# Title\n"
+    sha = git_blob_sha(data)
+
+    expect(store.add(sha, data)).to.be.true
+    expect(store.has(sha)).to.be.true
+
+    destination = join(root, 'README.md')
+    expect(store.materialize(sha, destination)).to.be.true
+    expect(open(destination, 'rb').read()).to.equal(data)
+    expect(os.stat(destination).st_ino).to.equal(os.stat(store.path_for(sha)).st_ino)
+
+
+@with_store()
+def test_add_rejects_contents_that_do_not_match(store, root):
+    "BlobStore.add refuses contents that don't hash to the given SHA"
+    expect(store.add(git_blob_sha(b"one"), b"two")).to.be.false
+    expect(store.has(git_blob_sha(b"one"))).to.be.false
+
+
+@with_store()
+def test_materialize_unknown_blob(store, root):
+    "BlobStore.materialize returns False for a blob that is not stored"
+    expect(store.materialize('a' * 40, join(root, 'missing'))).to.be.false
+    expect(exists(join(root, 'missing'))).to.be.false
+
+
+@with_store(max_size=30)
+def test_evict_least_recently_used(store, root):
+    "BlobStore evicts the least recently used blobs once it grows too big"
+    old, recent = b"o" * 10, b"r" * 10
+    store.add(git_blob_sha(old), old)
+    store.add(git_blob_sha(recent), recent)
+    past = time.time() - 60
+    os.utime(store.path_for(git_blob_sha(old)), (past, past))
+
+    partial = join(store.incoming, 'partial')
+    with open(partial, 'wb') as f:
+        f.write(b"p" * 100)
+
+    newest = b"n" * 15
+    store.add(git_blob_sha(newest), newest)
+
+    expect(store.has(git_blob_sha(old))).to.be.false
+    expect(store.has(git_blob_sha(recent))).to.be.true
+    expect(store.has(git_blob_sha(newest))).to.be.true
+    expect(exists(partial)).to.be.true
+
+
+@with_store()
+def test_materialize_blob_evicted_in_between(store, root):
+    "BlobStore.materialize returns False when the blob is evicted right before it is linked"
+    data = b"contents"
+    sha = git_blob_sha(data)
+    store.add(sha, data)
+
+    link = os.link
+
+    def evict_then_link(source, destination):
+        os.unlink(source)
+        return link(source, destination)
+
+    with patch('os.link', evict_then_link):
+        expect(store.materialize(sha, join(root, 'file'))).to.be.false
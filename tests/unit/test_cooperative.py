@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import gevent
+from sure import expect
+
+from markmentio.cooperative import cooperative_imap
+
+
+def test_yields_in_order():
+    ("cooperative_imap yields the results in the order of the items, "
+     "regardless of the order the greenlets finish in")
+    def slow_square(number):
+        gevent.sleep(0.01 * (5 - number))
+        return number * number
+
+    expect(list(cooperative_imap(slow_square, range(5), 3))).to.equal([0, 1, 4, 9, 16])
+
+
+def test_limits_the_fan_out():
+    ("cooperative_imap never runs more than `fan_out` greenlets at the "
+     "same time")
+    running = [0]
+    peak = [0]
+
+    def track(item):
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        gevent.sleep(0.01)
+        running[0] -= 1
+        return item
+
+    expect(list(cooperative_imap(track, range(10), 2))).to.equal(range(10))
+    expect(peak[0]).to.equal(2)
+
+
+def test_kills_the_rest_when_the_consumer_stops():
+    ("cooperative_imap kills the greenlets still running once its "
+     "consumer stops early")
+    finished = []
+
+    def slow(item):
+        gevent.sleep(item and 0.1 or 0.01)
+        finished.append(item)
+        return item
+
+    results = cooperative_imap(slow, range(4), 4)
+    expect(next(results)).to.equal(0)
+    results.close()
+    gevent.sleep(0.2)
+
+    expect(finished).to.equal([0])
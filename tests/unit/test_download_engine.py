@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+
+from sure import expect
+from markmentio.workers.downloader import DownloadEngine
+
+
+class SlowStem(object):
+    def __init__(self, persisted):
+        self.persisted = persisted
+
+    def persist(self, root):
+        time.sleep(0.1)
+        self.persisted.append(root)
+
+
+def test_persist_waits_for_submitted_blobs_when_listing_fails():
+    ("DownloadEngine.persist waits for the blobs already submitted "
+     "before re-raising an error of the pairs generator")
+    persisted = []
+
+    def pairs():
+        for index in range(3):
+            yield SlowStem(persisted), index
+        raise ValueError("tree listing failed")
+
+    engine = DownloadEngine(4)
+    expect(engine.persist).when.called_with(pairs(), 4).to.throw(ValueError, "tree listing failed")
+    expect(sorted(persisted)).to.equal([0, 1, 2])
+
+
+def test_persist_reraises_the_first_blob_failure():
+    "DownloadEngine.persist re-raises the error of a failed blob"
+    class BrokenStem(object):
+        def persist(self, root):
+            raise IOError("disk full")
+
+    engine = DownloadEngine(2)
+    expect(engine.persist).when.called_with([(BrokenStem(), None)], 2).to.throw(IOError, "disk full")
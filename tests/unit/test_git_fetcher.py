@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import subprocess
+
+from functools import wraps
+from mock import patch
+from sure import expect
+from os.path import join, exists, dirname
+
+from markmentio import settings
+from markmentio.workers.downloader import GitFetcher
+from markmentio.workers.workspaces import WorkspaceQuotaExceeded
+
+GIT = '/usr/bin/git'
+
+
+def git(cwd, *args):
+    env = dict(os.environ,
+               GIT_AUTHOR_NAME='markment', GIT_AUTHOR_EMAIL='markment@localhost',
+               GIT_COMMITTER_NAME='markment', GIT_COMMITTER_EMAIL='markment@localhost')
+    return subprocess.check_output([GIT] + list(args), cwd=cwd, env=env).strip()
+
+
+def commit(work_tree, path, contents):
+    with open(join(work_tree, path), 'w') as f:
+        f.write(contents)
+
+    git(work_tree, 'add', path)
+    git(work_tree, 'commit', '--quiet', '-m', path)
+    return git(work_tree, 'rev-parse', 'HEAD').decode('ascii')
+
+
+def with_remote(test):
+    """Runs `test` against a bare repository with two commits, served
+    from /tmp through GIT_REMOTE_URL"""
+    @wraps(test)
+    def decorated():
+        root = tempfile.mkdtemp()
+        try:
+            work_tree = join(root, 'work')
+            os.makedirs(work_tree)
+            git(work_tree, 'init', '--quiet')
+            first = commit(work_tree, 'index.md', '# First\n')
+            second = commit(work_tree, 'other.md', '# Second\n')
+
+            remote = join(root, 'remote', 'owner', 'repo.git')
+            git(root, 'clone', '--quiet', '--bare', work_tree, remote)
+
+            remote_url = 'file://' + join(root, 'remote', '{owner}', '{repository}.git')
+            with patch.object(settings, 'GIT_BIN_PATH', GIT), \
+                    patch.object(settings, 'GIT_REMOTE_URL', remote_url), \
+                    patch.object(settings, 'GIT_MIRROR_ROOT', join(root, 'mirrors')):
+                test(GitFetcher(None, join(root, 'checkout')), first, second)
+        finally:
+            shutil.rmtree(root, True)
+
+    return decorated
+
+
+@with_remote
+def test_fetch_checks_the_head_out(fetcher, first, second):
+    ("GitFetcher.fetch checks the head of the remote out into the destination")
+    fetcher.fetch('owner', 'repo')
+
+    expect(fetcher.commit).to.equal(second)
+    expect(open(join(fetcher.destination, 'index.md')).read()).to.equal('# First\n')
+    expect(open(join(fetcher.destination, 'other.md')).read()).to.equal('# Second\n')
+
+
+@with_remote
+def test_fetch_checks_an_older_commit_out(fetcher, first, second):
+    ("GitFetcher.fetch fetches a commit beyond GIT_FETCH_DEPTH and checks it out")
+    fetcher.fetch('owner', 'repo', tree=first)
+
+    expect(fetcher.commit).to.equal(first)
+    expect(open(join(fetcher.destination, 'index.md')).read()).to.equal('# First\n')
+    expect(exists(join(fetcher.destination, 'other.md'))).to.be.false
+
+
+@with_remote
+def test_fetch_raises_for_an_unknown_commit(fetcher, first, second):
+    ("GitFetcher.fetch raises instead of checking the head out when the "
+     "commit it was asked for does not exist")
+    unknown = '0' * 40
+    fetcher.fetch.when.called_with('owner', 'repo', tree=unknown).should.throw(
+        RuntimeError, 'owner/repo has no commit {0}'.format(unknown))
+
+    expect(exists(join(fetcher.destination, 'index.md'))).to.be.false
+
+
+@with_remote
+def test_tree_size(fetcher, first, second):
+    ("GitFetcher.tree_size adds up the size of every file of a commit")
+    fetcher.fetch('owner', 'repo')
+
+    expect(fetcher.tree_size(second)).to.equal(len('# First\n') + len('# Second\n'))
+
+
+@with_remote
+def test_fetch_enforces_the_quota(fetcher, first, second):
+    ("GitFetcher.fetch checks the quota before checking anything out, and "
+     "drops a mirror that grew over it")
+    fetcher.quota = 1
+
+    fetcher.fetch.when.called_with('owner', 'repo').should.throw(WorkspaceQuotaExceeded)
+
+    expect(exists(fetcher.mirror_path)).to.be.false
+    expect(exists(join(fetcher.destination, 'index.md'))).to.be.false
+
+
+@with_remote
+def test_fetch_refuses_anything_but_a_sha(fetcher, first, second):
+    ("GitFetcher.fetch only hands HEAD or a commit SHA to git, anything "
+     "else fails the build before git runs")
+    pwned = join(dirname(fetcher.clone_path), 'PWNED')
+    tree = "--upload-pack=touch {0}; git-upload-pack".format(pwned)
+
+    fetcher.fetch.when.called_with('owner', 'repo', tree=tree).should.throw(ValueError)
+    fetcher.fetch.when.called_with('owner', 'repo', tree='master').should.throw(ValueError)
+
+    expect(exists(pwned)).to.be.false
+    expect(exists(fetcher.mirror_path)).to.be.false
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import json
+import shutil
+import tempfile
+
+from sure import expect
+from os.path import join, exists, isdir
+
+from markmentio.workers.downloader import IncrementalFetcher
+from markmentio.workers.workspaces import WorkspaceQuotaExceeded
+
+
+class Sink(object):
+    def __init__(self):
+        self.messages = []
+
+    def push(self, message):
+        self.messages.append(message)
+
+
+class ListingAPI(object):
+    def __init__(self, listing):
+        self.listing = listing
+
+    def retrieve(self, path, skip_cache=False):
+        if path.startswith('/repos/owner/repo/commits/'):
+            reply = {'sha': 'c' * 40, 'commit': {'tree': {'sha': 't' * 40}}}
+        else:
+            reply = {'sha': 't' * 40, 'truncated': False, 'tree': self.listing}
+        return {'response_data': json.dumps(reply)}
+
+
+class NoSyncRedis(object):
+    def hget(self, key, field):
+        return None
+
+    def hdel(self, key, field):
+        pass
+
+
+def blob(path, sha):
+    return {'path': path, 'type': 'blob', 'sha': sha, 'size': 1, 'url': 'https://api.github.com/blob/' + sha}
+
+
+def tree(path, sha):
+    return {'path': path, 'type': 'tree', 'sha': sha, 'url': 'https://api.github.com/tree/' + sha}
+
+
+def write(path):
+    if not exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+        f.write('x')
+
+
+def test_walk_changes():
+    ("IncrementalFetcher.walk_changes removes what is gone and yields "
+     "only the blobs that are new or changed")
+    root = tempfile.mkdtemp()
+    try:
+        fetcher = IncrementalFetcher(None, root, redis=object(), sink=Sink())
+        fetcher.owner, fetcher.repository = 'owner', 'repo'
+        destination = fetcher.destination
+        for path in ['same.md', 'gone.md', 'docs/changed.md', 'kind/file.md']:
+            write(join(destination, path))
+
+        previous = {
+            'same.md': ['blob', 's1'],
+            'gone.md': ['blob', 'g1'],
+            'docs': ['tree', 'd1'],
+            'docs/changed.md': ['blob', 'c1'],
+            'kind': ['tree', 'k1'],
+            'kind/file.md': ['blob', 'f1'],
+        }
+        listing = [
+            blob('same.md', 's1'),
+            tree('docs', 'd2'),
+            blob('docs/changed.md', 'c2'),
+            tree('images', 'i1'),
+            blob('images/new.png', 'n1'),
+            blob('kind', 'k2'),
+        ]
+
+        pairs = list(fetcher.walk_changes(previous, listing))
+
+        expect(sorted(stem.path for stem, root in pairs)).to.equal(['docs/changed.md', 'images/new.png', 'kind'])
+        expect(set(root for stem, root in pairs)).to.equal(set([destination]))
+        expect(exists(join(destination, 'same.md'))).to.be.true
+        expect(exists(join(destination, 'gone.md'))).to.be.false
+        expect(exists(join(destination, 'docs/changed.md'))).to.be.false
+        expect(exists(join(destination, 'kind'))).to.be.false
+        expect(isdir(join(destination, 'images'))).to.be.true
+    finally:
+        shutil.rmtree(root, True)
+
+
+def test_grab_tree_stays_in_the_sync_root():
+    ("IncrementalFetcher never deletes nor writes anything outside of its "
+     "sync root, even when a symlink in it points somewhere else")
+    root = tempfile.mkdtemp()
+    try:
+        sync_root = join(root, 'sync')
+        victim = join(root, 'victim')
+        write(join(victim, 'keep.md'))
+        os.makedirs(sync_root)
+        os.symlink(root, join(sync_root, 'owner'))
+
+        fetcher = IncrementalFetcher(None, sync_root, redis=object(), sink=Sink())
+        fetcher.fetch.when.called_with('..', '..').should.throw(ValueError)
+
+        fetcher.owner, fetcher.repository = 'owner', 'victim'
+        fetcher.grab_tree.when.called_with('HEAD').should.throw(ValueError)
+
+        expect(exists(join(victim, 'keep.md'))).to.be.true
+        expect(exists(join(root, 'victim.tree.json'))).to.be.false
+    finally:
+        shutil.rmtree(root, True)
+
+
+def test_grab_tree_enforces_the_quota():
+    ("IncrementalFetcher checks the size of the whole listing against the "
+     "quota before fetching anything")
+    root = tempfile.mkdtemp()
+    try:
+        api = ListingAPI([blob('a.md', 'a1'), blob('b.md', 'b1')])
+        fetcher = IncrementalFetcher(api, root, redis=NoSyncRedis(), sink=Sink())
+        fetcher.quota = 1
+
+        fetcher.fetch.when.called_with('owner', 'repo').should.throw(WorkspaceQuotaExceeded)
+        expect(exists(fetcher.destination)).to.be.false
+    finally:
+        shutil.rmtree(root, True)
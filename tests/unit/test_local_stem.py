@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+
+from sure import expect
+from os.path import join
+
+from markmentio.workers.blobstore import BlobStore, git_blob_sha
+from markmentio.workers.downloader import LocalStem
+
+
+class Sink(object):
+    def push(self, message):
+        pass
+
+
+class BrokenResponse(object):
+    closed = False
+
+    def iter_content(self, chunk_size):
+        yield b"half of the"
+        raise IOError("connection reset")
+
+    def close(self):
+        self.closed = True
+
+
+class TruncatedResponse(BrokenResponse):
+    def iter_content(self, chunk_size):
+        yield b"half of the"
+
+
+class StreamingAPI(object):
+    def __init__(self, response):
+        self.response = response
+
+    def stream(self, path, headers=None):
+        return self.response
+
+
+def test_stream_blob_removes_partial_downloads():
+    "LocalStem.stream_blob leaves nothing in the store when a download fails halfway"
+    root = tempfile.mkdtemp()
+    try:
+        store = BlobStore(join(root, 'blobs'), 1024 * 1024)
+        response = BrokenResponse()
+        stem = LocalStem({
+            'path': 'README.md',
+            'type': 'blob',
+            'sha': git_blob_sha(b"half of the file"),
+            'size': 16,
+            'url': 'https://api.github.com/repos/owner/repo/git/blobs/abc',
+        }, StreamingAPI(response), store=store, sink=Sink())
+
+        expect(stem.stream_blob).when.called_with(join(root, 'README.md')).to.throw(IOError, "connection reset")
+        expect(os.listdir(store.incoming)).to.be.empty
+        expect(response.closed).to.be.true
+    finally:
+        shutil.rmtree(root, True)
+
+
+def truncated_stem(store):
+    return LocalStem({
+        'path': 'README.md',
+        'type': 'blob',
+        'sha': git_blob_sha(b"half of the file"),
+        'size': 16,
+        'url': 'https://api.github.com/repos/owner/repo/git/blobs/abc',
+    }, StreamingAPI(TruncatedResponse()), store=store, sink=Sink())
+
+
+def test_stream_blob_rejects_corrupted_downloads():
+    ("LocalStem.stream_blob raises when the contents it got do not hash "
+     "to the SHA of the blob, leaving nothing behind in the store")
+    root = tempfile.mkdtemp()
+    try:
+        store = BlobStore(join(root, 'blobs'), 1024 * 1024)
+        stem = truncated_stem(store)
+
+        expect(stem.stream_blob).when.called_with(join(root, 'README.md')).to.throw(IOError, "README.md got SHA")
+        expect(os.listdir(store.incoming)).to.be.empty
+        expect(os.listdir(root)).to.equal(['blobs'])
+    finally:
+        shutil.rmtree(root, True)
+
+
+def test_stream_blob_checks_the_sha_without_a_store():
+    "LocalStem.stream_blob checks the SHA of the blob even when there is no store"
+    root = tempfile.mkdtemp()
+    try:
+        stem = truncated_stem(None)
+
+        expect(stem.stream_blob).when.called_with(join(root, 'README.md')).to.throw(IOError, "README.md got SHA")
+        expect(os.listdir(root)).to.be.empty
+    finally:
+        shutil.rmtree(root, True)
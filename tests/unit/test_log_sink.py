@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import time
+from threading import Thread
+from sure import expect
+
+from markmentio.workers.logsink import LogSink
+
+
+class SlowRedis(object):
+    """Takes its time executing the first pipeline only"""
+    def __init__(self):
+        self.lists = {}
+        self.executed = 0
+
+    def pipeline(self, transaction=True):
+        return SlowPipeline(self)
+
+
+class SlowPipeline(object):
+    def __init__(self, redis):
+        self.redis = redis
+        self.pushes = []
+
+    def rpush(self, key, *values):
+        self.pushes.append((key, values))
+
+    def execute(self):
+        self.redis.executed += 1
+        if self.redis.executed == 1:
+            time.sleep(0.1)
+
+        for key, values in self.pushes:
+            self.redis.lists.setdefault(key, []).extend(values)
+
+
+def test_flushes_keep_their_order():
+    ("LogSink pushes its batches in order even when two flushes run at "
+     "the same time")
+    redis = SlowRedis()
+    sink = LogSink(redis, key='logs', max_size=100, max_delay=60)
+
+    sink.push('first')
+    flusher = Thread(target=sink.flush)
+    flusher.start()
+    time.sleep(0.01)
+
+    sink.push('second')
+    sink.flush()
+    flusher.join()
+
+    messages = [json.loads(m)['message'] for m in redis.lists['logs']]
+    expect(messages).to.equal(['first', 'second'])
+
+
+def test_flushes_when_full():
+    "LogSink flushes as soon as it holds `max_size` messages"
+    redis = SlowRedis()
+    redis.executed = 1
+    sink = LogSink(redis, key='logs', max_size=2, max_delay=60)
+
+    sink.push('one')
+    expect(redis.lists).to.be.empty
+    sink.push('two')
+
+    expect([json.loads(m)['message'] for m in redis.lists['logs']]).to.equal(['one', 'two'])
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from mock import patch
+from sure import expect
+
+from markmentio.cache import LRUCache
+
+
+def test_evicts_the_least_recently_used():
+    ("LRUCache drops the least recently used entry once it holds more "
+     "than `max_entries`")
+    cache = LRUCache(2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    expect(cache.get('a')).to.equal(1)
+
+    cache.set('c', 3)
+
+    expect(len(cache)).to.equal(2)
+    expect(cache.get('b')).to.be.none
+    expect(cache.get('a')).to.equal(1)
+    expect(cache.get('c')).to.equal(3)
+
+
+def test_evicts_by_size():
+    ("LRUCache drops entries until their sizes add up to `max_bytes` at "
+     "most, and never keeps a value bigger than that")
+    cache = LRUCache(10, ttl=60, max_bytes=100)
+    cache.set('a', 'a', size=40)
+    cache.set('b', 'b', size=40)
+    cache.set('c', 'c', size=40)
+
+    expect(cache.get('a')).to.be.none
+    expect(cache.size).to.equal(80)
+
+    cache.set('huge', 'huge', size=101)
+    expect(cache.get('huge')).to.be.none
+    expect(cache.size).to.equal(80)
+
+
+def test_replacing_a_key_keeps_the_size():
+    ("LRUCache accounts for the previous value of a key that is set again")
+    cache = LRUCache(10, ttl=60, max_bytes=100)
+    cache.set('a', 'old', size=60)
+    cache.set('a', 'new', size=30)
+
+    expect(cache.get('a')).to.equal('new')
+    expect(cache.size).to.equal(30)
+
+
+@patch('markmentio.cache.time.time')
+def test_expires_entries(now):
+    ("LRUCache forgets an entry after `ttl` seconds, or earlier when it "
+     "is given an earlier expiration")
+    now.return_value = 1000
+    cache = LRUCache(10, ttl=60)
+    cache.set('ttl', 1, size=10)
+    cache.set('early', 2, expires_at=1010, size=10)
+
+    now.return_value = 1009
+    expect(cache.get('early')).to.equal(2)
+
+    now.return_value = 1010
+    expect(cache.get('early')).to.be.none
+    expect(cache.get('ttl')).to.equal(1)
+
+    now.return_value = 1060
+    expect(cache.get('ttl')).to.be.none
+    expect(cache.size).to.equal(0)
+
+
+def test_delete():
+    ("LRUCache.delete forgets a key and its size, unknown keys are ignored")
+    cache = LRUCache(10, ttl=60)
+    cache.set('a', 1, size=10)
+    cache.delete('a')
+    cache.delete('unknown')
+
+    expect(cache.get('a')).to.be.none
+    expect(len(cache)).to.equal(0)
+    expect(cache.size).to.equal(0)
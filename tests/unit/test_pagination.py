@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+from threading import Lock
+from sure import expect
+
+from markmentio.api import Resource, bounded_imap
+
+
+def paginated(next_page, last_page):
+    link = ('<https://api.github.com/user/54914/repos?sort=pushed&page={0}>; rel="next", '
+            '<https://api.github.com/user/54914/repos?sort=pushed&page={1}>; rel="last"')
+    return {'response_headers': {'Link': link.format(next_page, last_page)}}
+
+
+def test_bounded_imap_yields_in_order():
+    ("bounded_imap yields the results in the order of the items, "
+     "regardless of the order the calls finish in")
+    def slow_square(number):
+        time.sleep(0.01 * (5 - number))
+        return number * number
+
+    expect(list(bounded_imap(slow_square, range(5), 3))).to.equal([0, 1, 4, 9, 16])
+
+
+def test_bounded_imap_limits_the_fan_out():
+    ("bounded_imap never runs more than `fan_out` calls at the same time")
+    lock = Lock()
+    running = [0]
+    peak = [0]
+
+    def track(item):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+
+        return item
+
+    expect(list(bounded_imap(track, range(10), 2))).to.equal(range(10))
+    expect(peak[0]).to.equal(2)
+
+
+def test_bounded_imap_reraises_in_turn():
+    ("bounded_imap yields the results before the failed one and then "
+     "re-raises its error")
+    def explode_on_two(number):
+        if number == 2:
+            raise ValueError("two")
+        return number
+
+    results = bounded_imap(explode_on_two, range(5), 3)
+    expect(next(results)).to.equal(0)
+    expect(next(results)).to.equal(1)
+    next.when.called_with(results).should.throw(ValueError, "two")
+
+
+def test_get_page_paths():
+    ("Resource.get_page_paths lists the path of every page from the next "
+     "one up to the last one")
+    resource = Resource(None)
+
+    expect(resource.get_page_paths(paginated(2, 4))).to.equal([
+        '/user/54914/repos?sort=pushed&page=2',
+        '/user/54914/repos?sort=pushed&page=3',
+        '/user/54914/repos?sort=pushed&page=4',
+    ])
+
+
+def test_get_page_paths_without_last():
+    ("Resource.get_page_paths returns None when github does not tell "
+     "which page is the last one")
+    resource = Resource(None)
+    link = '<https://api.github.com/user/54914/repos?page=2>; rel="next"'
+
+    expect(resource.get_page_paths({'response_headers': {'Link': link}})).to.be.none
+    expect(resource.get_page_paths({'response_headers': {}})).to.be.none
+
+
+class Killed(BaseException):
+    "Stands for the GreenletExit of a greenlet killed halfway"
+
+
+def test_bounded_imap_reraises_base_exceptions():
+    ("bounded_imap re-raises errors that are not an Exception too, "
+     "instead of waiting forever for their result")
+    def killed_on_one(number):
+        if number == 1:
+            raise Killed()
+        return number
+
+    results = bounded_imap(killed_on_one, range(3), 2)
+    expect(next(results)).to.equal(0)
+    try:
+        next(results)
+    except Killed:
+        pass
+    else:
+        raise AssertionError("Killed was not re-raised")
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+from sure import expect
+
+from markmentio.ready import was_built, migrate, get_ready_index, LEGACY_READY_KEY
+
+
+class FakeRedis(object):
+    """Just the hashes and strings the ready docs are kept in"""
+    def __init__(self, hashes=None):
+        self.hashes = hashes or {}
+        self.strings = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hdel(self, key, field):
+        self.hashes.get(key, {}).pop(field, None)
+
+    def set(self, key, value):
+        self.strings[key] = value
+
+    def get(self, key):
+        return self.strings.get(key)
+
+
+class FakePipeline(object):
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        method = getattr(self.redis, name)
+        return lambda *args: self.calls.append((method, args))
+
+    def execute(self):
+        return [method(*args) for method, args in self.calls]
+
+
+BUILT = {
+    'success': True,
+    'repository': {'name': 'repo', 'owner': {'name': 'Owner'}},
+    'bucket': {'url': 'http://owner-repo.example.com'},
+    'commit': '0' * 40,
+    'index': ['index.html'],
+}
+FAILED = {
+    'success': False,
+    'repository': {'name': 'broken', 'owner': {'name': 'Owner'}},
+}
+
+
+def test_was_built():
+    ("was_built tells uploaded builds apart from failed payloads")
+    expect(was_built(BUILT)).to.be.true
+    expect(was_built(FAILED)).to.be.false
+    expect(was_built(dict(BUILT, success=False))).to.be.false
+    expect(was_built({'repository': BUILT['repository']})).to.be.false
+
+
+def test_migrate_skips_failed_builds():
+    ("migrate moves the builds of the legacy hash and drops the failed ones")
+    redis = FakeRedis({LEGACY_READY_KEY: {
+        'Owner/repo': json.dumps(BUILT),
+        'Owner/broken': json.dumps(FAILED),
+    }})
+
+    expect(migrate(redis)).to.equal(1)
+    expect(redis.hgetall(LEGACY_READY_KEY)).to.be.empty
+    expect(redis.hgetall('markmentio:ready:owner').keys()).to.equal(['Owner/repo'])
+    expect(get_ready_index(redis, 'Owner/repo')).to.equal(['index.html'])
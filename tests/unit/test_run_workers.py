@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+from sure import expect
+
+from markmentio.commands import RunWorkers, PENDING_BUILDS
+
+
+class QueueRedis(object):
+    """Just the list and the hash the build queue is kept in"""
+    def __init__(self, builds):
+        self.builds = [json.dumps(build) for build in builds]
+        self.hashes = {}
+
+    def lpop(self, key):
+        return self.builds and self.builds.pop(0) or None
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hdel(self, key, field):
+        return int(self.hashes.get(key, {}).pop(field, None) is not None)
+
+
+def build(name, after):
+    return {'repository': {'name': name, 'owner': {'name': 'owner'}}, 'after': after}
+
+
+def test_next_build_serializes_each_repository():
+    ("RunWorkers.next_build skips repositories being built, keeping only "
+     "their latest build in redis until they are done")
+    redis = QueueRedis([build('docs', 'a'), build('docs', 'b'), build('docs', 'c'), build('site', 'd')])
+    workers = RunWorkers()
+
+    expect(workers.next_build(redis, set())).to.equal(build('docs', 'a'))
+    expect(workers.next_build(redis, set(['owner/docs']))).to.equal(build('site', 'd'))
+    expect(workers.next_build(redis, set(['owner/docs', 'owner/site']))).to.be.none
+    expect(json.loads(redis.hashes[PENDING_BUILDS]['owner/docs'])).to.equal(build('docs', 'c'))
+
+    expect(workers.next_build(redis, set(['owner/site']))).to.equal(build('docs', 'c'))
+    expect(redis.hashes[PENDING_BUILDS]).to.be.empty
+    expect(workers.next_build(redis, set())).to.be.none
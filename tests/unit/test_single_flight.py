@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+
+from threading import Event, Thread
+from sure import expect
+
+from markmentio.cache import SingleFlight
+
+
+def run_concurrently(flight, key, function, callers):
+    """Calls `flight.do(key, function)` from `callers` threads, returns
+    what each one of them got back"""
+    outcomes = []
+
+    def call():
+        try:
+            outcomes.append(flight.do(key, function))
+        except Exception as e:
+            outcomes.append(e)
+
+    threads = [Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+
+    return threads, outcomes
+
+
+def test_coalesces_concurrent_calls():
+    ("SingleFlight.do runs the function once for concurrent callers of "
+     "the same key, and hands them all its result")
+    flight = SingleFlight()
+    release = Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait()
+        return 'value'
+
+    threads, outcomes = run_concurrently(flight, 'key', fetch, 5)
+    # gives every caller the time to join the call
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    expect(calls).to.equal([1])
+    expect(outcomes).to.equal(['value'] * 5)
+    expect(flight.calls).to.be.empty
+
+
+def test_shares_the_exception():
+    ("SingleFlight.do raises the leader's exception for every caller "
+     "that joined its call")
+    flight = SingleFlight()
+    release = Event()
+
+    def fail():
+        release.wait()
+        raise ValueError("boom")
+
+    threads, outcomes = run_concurrently(flight, 'key', fail, 3)
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    expect(len(outcomes)).to.equal(3)
+    expect(all(isinstance(e, ValueError) for e in outcomes)).to.be.true
+    expect(flight.calls).to.be.empty
+
+
+def test_calls_after_the_flight_run_again():
+    ("SingleFlight.do runs the function again once the previous call "
+     "for the key is done")
+    flight = SingleFlight()
+    values = iter([1, 2])
+
+    expect(flight.do('key', lambda: next(values))).to.equal(1)
+    expect(flight.do('key', lambda: next(values))).to.equal(2)
+
+
+def test_do_in_background():
+    ("SingleFlight.do_in_background starts a single call per key")
+    flight = SingleFlight()
+    release = Event()
+    done = Event()
+
+    def refresh():
+        release.wait()
+        done.set()
+
+    expect(flight.do_in_background('key', refresh)).to.be.true
+    expect(flight.do_in_background('key', refresh)).to.be.false
+
+    release.set()
+    done.wait(1)
+    expect(done.is_set()).to.be.true
+
+
+class Killed(BaseException):
+    "Stands for the GreenletExit of a greenlet killed halfway"
+
+
+def test_a_killed_leader_hands_the_call_over():
+    ("SingleFlight.do runs the function again for the callers that were "
+     "waiting on a leader killed before it got an outcome")
+    flight = SingleFlight()
+    release = Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        if len(calls) == 1:
+            release.wait()
+            raise Killed()
+        return 'value'
+
+    killed = []
+    outcomes = []
+
+    def lead():
+        try:
+            flight.do('key', fetch)
+        except Killed as e:
+            killed.append(e)
+
+    leader = Thread(target=lead)
+    leader.start()
+    time.sleep(0.05)
+    follower = Thread(target=lambda: outcomes.append(flight.do('key', fetch)))
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join(1)
+    follower.join(1)
+
+    expect(killed).to.have.length_of(1)
+    expect(outcomes).to.equal(['value'])
+    expect(calls).to.equal([1, 1])
+    expect(flight.calls).to.be.empty
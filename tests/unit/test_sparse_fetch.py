@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import base64
+
+from sure import expect
+
+from markmentio.workers.downloader import RepositoryFetcher
+
+
+class ConfigAPI(object):
+    """Replies to blob requests with the contents of `.markment.yml` files"""
+    def __init__(self, configs):
+        self.configs = configs
+
+    def retrieve(self, path, skip_cache=False):
+        contents = self.configs[path.rsplit('/', 1)[-1]]
+        return {'response_data': json.dumps({
+            'content': base64.b64encode(contents),
+            'encoding': 'base64',
+        })}
+
+
+def entry(path, kind='blob', size=10):
+    sha = path.replace('/', '-')
+    return {'path': path, 'type': kind, 'sha': sha, 'size': size,
+            'url': 'https://api.github.com/repos/owner/repo/git/blobs/{0}'.format(sha)}
+
+
+def make_fetcher(configs, sparse=True):
+    fetcher = RepositoryFetcher(ConfigAPI(configs), None, sparse=sparse, sink=object())
+    fetcher.owner, fetcher.repository = 'owner', 'repo'
+    return fetcher
+
+
+LISTING = [
+    entry('docs', 'tree'),
+    entry('docs/.markment.yml'),
+    entry('docs/index.md'),
+    entry('docs/build.py', size=100),
+    entry('docs/img', 'tree'),
+    entry('docs/img/logo.png'),
+    entry('theme', 'tree'),
+    entry('theme/base.html'),
+    entry('theme/helpers.py', size=5),
+    entry('src', 'tree'),
+    entry('src/app.py', size=1000),
+    entry('src/NOTES.md'),
+]
+
+
+def test_narrow_keeps_what_markment_needs():
+    ("RepositoryFetcher.narrow keeps the assets of each project and its "
+     "whole theme, counting what it skips")
+    fetcher = make_fetcher({'docs-.markment.yml': b"project:\n  theme: ../theme\n"})
+
+    kept = fetcher.narrow(LISTING)
+
+    expect(sorted(e['path'] for e in kept)).to.equal([
+        'docs',
+        'docs/.markment.yml',
+        'docs/img',
+        'docs/img/logo.png',
+        'docs/index.md',
+        'theme',
+        'theme/base.html',
+        'theme/helpers.py',
+    ])
+    expect(fetcher.skipped_files).to.equal(3)
+    expect(fetcher.skipped_bytes).to.equal(1110)
+
+
+def test_narrow_ignores_themes_outside_of_the_repository():
+    "RepositoryFetcher.narrow never keeps a theme that points outside of the repository"
+    fetcher = make_fetcher({'docs-.markment.yml': b"project:\n  theme: ../../elsewhere\n"})
+
+    kept = fetcher.narrow(LISTING)
+
+    expect([e['path'] for e in kept if e['path'].startswith('theme')]).to.be.empty
+
+
+def test_narrow_without_markment_yml_keeps_everything():
+    "RepositoryFetcher.narrow keeps the whole listing when there is no .markment.yml"
+    listing = [e for e in LISTING if not e['path'].endswith('.markment.yml')]
+    expect(make_fetcher({}).narrow(listing)).to.equal(listing)
+
+
+def test_narrow_is_a_no_op_unless_sparse():
+    "RepositoryFetcher.narrow returns the listing untouched when not fetching sparsely"
+    expect(make_fetcher({}, sparse=False).narrow(LISTING)).to.equal(LISTING)